@@ -0,0 +1,172 @@
+"""Generate synthetic Sphinx projects that exercise the sphinx-panels components.
+
+Each generated document contains ``directives`` instances of every component
+(``panels``, ``tabbed``, ``dropdown``, ``div``, ``link-button``, ``:badge:``
+and ``:opticon:``), and the ``tabbed`` / ``dropdown`` blocks are nested
+``depth`` levels deep.
+"""
+import argparse
+from pathlib import Path
+import textwrap
+
+CONF_PY = """\
+extensions = ["sphinx_panels"]
+master_doc = "index"
+exclude_patterns = ["_build"]
+"""
+
+OPTICONS = ("check-circle", "x", "alert", "info", "clock")
+
+
+def indent(text: str, level: int = 1) -> str:
+    return textwrap.indent(text, "    " * level)
+
+
+def make_panels(doc: int, index: int) -> str:
+    cards = []
+    for card in range(4):
+        cards.append(
+            textwrap.dedent(
+                f"""\
+                ---
+                :card: + shadow-sm
+                :img-top: https://example.com/{doc}-{index}-{card}.png
+
+                Card {card} header
+                ^^^^^^^^^^^^^^^^^^
+                Card {card} body with **strong** text and an
+                :badge:`badge-{card},badge-primary` badge.
+
+                ++++++++++++++++++
+                Card {card} footer
+                """
+            )
+        )
+    return ".. panels::\n    :column: col-lg-3 p-1\n\n" + indent("".join(cards))
+
+
+def make_nested(doc: int, index: int, depth: int) -> str:
+    """Alternate ``tabbed`` and ``dropdown`` blocks, ``depth`` levels deep."""
+    body = f"Leaf content {doc}-{index} :opticon:`{OPTICONS[index % len(OPTICONS)]}`\n"
+    for level in range(depth, 0, -1):
+        if level % 2:
+            tabs = []
+            for tab in range(3):
+                inner = body if tab == 0 else f"Tab {tab} content at level {level}\n"
+                tabs.append(f".. tabbed:: Tab {tab}\n\n{indent(inner)}\n")
+            body = "".join(tabs)
+        else:
+            body = f".. dropdown:: Level {level}\n    :animate: fade-in\n\n" + indent(
+                body
+            )
+    return body
+
+
+def make_tabbed(doc: int, index: int, depth: int) -> str:
+    tabs = []
+    for tab in range(3):
+        options = "    :new-group:\n" if tab == 0 else ""
+        options += "    :selected:\n" if tab == 1 else ""
+        content = f"Tab {tab} of set {index} in document {doc}.\n"
+        if tab == 0 and depth > 1:
+            content += "\n" + make_nested(doc, index, depth - 1)
+        tabs.append(f".. tabbed:: Tab {tab}\n{options}\n{indent(content)}\n")
+    return "".join(tabs)
+
+
+def make_dropdown(doc: int, index: int, depth: int) -> str:
+    content = f"Dropdown {index} content in document {doc}.\n"
+    if depth > 1:
+        content += "\n" + make_nested(doc, index, depth - 1)
+    title = f" Dropdown {index}" if index % 2 else ""
+    return (
+        f".. dropdown::{title}\n"
+        "    :container: + shadow\n"
+        "    :title: bg-primary text-white\n\n"
+        f"{indent(content)}\n"
+    )
+
+
+def make_div(doc: int, index: int) -> str:
+    return (
+        ".. div:: bg-light p-2\n\n"
+        f"    Div {index} content in document {doc},\n"
+        "    over two lines.\n"
+    )
+
+
+def make_link_button(doc: int, index: int) -> str:
+    return (
+        f".. link-button:: https://example.com/{doc}/{index}\n"
+        f"    :text: Button {index}\n"
+        "    :classes: btn-outline-primary btn-block\n"
+    )
+
+
+def make_inline_roles(doc: int, index: int) -> str:
+    icon = OPTICONS[index % len(OPTICONS)]
+    return (
+        f"Status :opticon:`{icon}` :badge:`v{index},badge-secondary badge-pill` "
+        f":link-badge:`https://example.com/{doc},link {index},cls=badge-info` "
+        f":opticon:`{icon},size=24`\n"
+    )
+
+
+def make_document(doc: int, directives: int, depth: int) -> str:
+    title = f"Document {doc}"
+    parts = [f"{title}\n{'=' * len(title)}\n"]
+    for index in range(directives):
+        section = f"Section {index}"
+        parts.append(f"{section}\n{'-' * len(section)}\n")
+        parts.append(make_panels(doc, index))
+        parts.append(make_tabbed(doc, index, depth))
+        parts.append(make_dropdown(doc, index, depth))
+        parts.append(make_div(doc, index))
+        parts.append(make_link_button(doc, index))
+        parts.append(make_inline_roles(doc, index))
+    return "\n".join(parts)
+
+
+def generate_corpus(
+    path: Path, documents: int = 10, directives: int = 5, depth: int = 2
+) -> Path:
+    """Write a Sphinx project to ``path``, returning the source directory."""
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    (path / "conf.py").write_text(CONF_PY, encoding="utf8")
+    names = [f"doc{doc:05d}" for doc in range(documents)]
+    toctree = ".. toctree::\n    :maxdepth: 1\n\n" + indent("\n".join(names))
+    (path / "index.rst").write_text(f"Index\n=====\n\n{toctree}\n", encoding="utf8")
+    for doc, name in enumerate(names):
+        (path / f"{name}.rst").write_text(
+            make_document(doc, directives, depth), encoding="utf8"
+        )
+    return path
+
+
+def add_corpus_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "-n", "--documents", type=int, default=10, help="Number of documents"
+    )
+    parser.add_argument(
+        "-m",
+        "--directives",
+        type=int,
+        default=5,
+        help="Number of directives of each kind per document",
+    )
+    parser.add_argument(
+        "-d", "--depth", type=int, default=2, help="Nesting depth of tabs/dropdowns"
+    )
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", type=Path, help="Directory to write the project to")
+    add_corpus_arguments(parser)
+    options = parser.parse_args(args)
+    generate_corpus(options.path, options.documents, options.directives, options.depth)
+
+
+if __name__ == "__main__":
+    main()
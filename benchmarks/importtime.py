@@ -0,0 +1,79 @@
+"""Time importing and setting up sphinx-panels in a new process, with ``-X importtime``.
+
+Sphinx itself is imported first, so that only the sphinx-panels modules are timed.
+``setup`` imports the package and runs ``setup()``, as ``sphinx-build`` does,
+which only imports the components that are needed by every build
+(not those only needed by HTML builds, or turned on by a config value).
+``all`` also imports every component module, as happens when a project uses
+all of the directives (and as ``setup()`` did before they were loaded lazily).
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+PRELUDE = """\
+import sphinx.application, sphinx.builders.html, sphinx.util.docutils
+"""
+
+STATEMENTS = {
+    "setup": """\
+from unittest import mock
+import sphinx_panels
+sphinx_panels.setup(mock.Mock())
+""",
+    "all": """\
+import sphinx_panels
+import sphinx_panels.button, sphinx_panels.dropdown, sphinx_panels.panels
+import sphinx_panels.tabs, sphinx_panels.transforms
+""",
+}
+
+
+def parse_importtime(stderr: str):
+    """Return the self time, in microseconds, of each imported module."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_time, _, name = line[len("import time:") :].split("|")
+        if self_time.strip().isdigit():
+            times[name.strip()] = int(self_time)
+    return times
+
+
+def time_statement(name: str, repeat: int):
+    """Return the median import time of the sphinx-panels modules, and their names."""
+    code = PRELUDE + STATEMENTS[name]
+    # the bytecode is cached by the first run, so it is not compiled in the timed runs
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    totals = []
+    for index in range(repeat + 1):
+        output = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            stderr=subprocess.PIPE,
+            text=True,
+            check=True,
+            env=env,
+        )
+        times = parse_importtime(output.stderr)
+        modules = sorted(m for m in times if m.split(".")[0] == "sphinx_panels")
+        if index:
+            totals.append(sum(times[m] for m in modules))
+    return statistics.median(totals), modules
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-r", "--repeat", type=int, default=10)
+    options = parser.parse_args(args)
+    for name in STATEMENTS:
+        total, modules = time_statement(name, options.repeat)
+        print(f"{name:<6} {total / 1000:7.3f} ms  ({len(modules)} modules)")
+        print("       " + ", ".join(modules))
+
+
+if __name__ == "__main__":
+    main()
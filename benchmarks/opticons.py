@@ -0,0 +1,59 @@
+"""Time loading the opticon data, and rendering the first icon, in a new process.
+
+Compares parsing the full ``opticons.json`` (the original ``lru_cache(1)``
+approach) with reading the compiled, memory-mapped ``opticons.index``.
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+SETUP = "from time import perf_counter; start = perf_counter()\n"
+
+STATEMENTS = {
+    "json": """\
+import json
+from pathlib import Path
+import sphinx_panels
+path = Path(sphinx_panels.__file__).parent / "data" / "opticons.json"
+data = json.loads(path.read_text())
+loaded = perf_counter()
+svg = data["report"]["heights"]["16"]["path"]
+""",
+    "index": """\
+from sphinx_panels.icons import get_opticon_index
+index = get_opticon_index()
+loaded = perf_counter()
+svg = index.get("report", 16)["path"]
+""",
+}
+
+REPORT = "print(loaded - start, perf_counter() - start)\n"
+
+
+def time_approach(name: str, repeat: int):
+    # import the package first, so that only the data loading is timed
+    code = "import sphinx_panels.icons\n" + SETUP + STATEMENTS[name] + REPORT
+    loads, firsts = [], []
+    for _ in range(repeat):
+        output = subprocess.check_output([sys.executable, "-c", code], text=True)
+        load, first = (float(value) for value in output.split())
+        loads.append(load)
+        firsts.append(first)
+    return statistics.median(loads), statistics.median(firsts)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-r", "--repeat", type=int, default=20)
+    options = parser.parse_args(args)
+    for name in STATEMENTS:
+        load, first = time_approach(name, options.repeat)
+        print(
+            f"{name:<6} load: {load * 1000:7.3f} ms  "
+            f"first icon: {first * 1000:7.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Time parsing the inputs of the roles: ``opticon``, ``fa``, ``badge``, ``link-badge``.
+
+Usage::
+
+    python benchmarks/roles.py -n 10000 -r 5
+
+Compares the original regex parser with ``utils.string_to_func_inputs``,
+on ``n`` role inputs, drawn from a small set of realistic inputs (as in API tables,
+where the same badges are repeated), with and without its cache,
+and on a long, quoted input.
+"""
+from ast import literal_eval
+import argparse
+import random
+import re
+from time import perf_counter
+
+from sphinx_panels import utils
+
+INPUTS = (
+    "report",
+    "report,size=24",
+    "alert,text-danger,size=16",
+    'check-circle, size=24, classes="text-success mr-1"',
+    "check,mr-1",
+    "eye,mr-1",
+    "github,style=fab",
+    "arrows-alt,mr-1",
+    "deprecated,badge-danger badge-pill",
+    "new,badge-primary",
+    "experimental,badge-warning",
+    "https://example.com,cls=badge-primary text-white",
+    'https://example.com,"Example, with comma",cls=badge-secondary',
+    'api/reference,"API reference",ref,cls=badge-info,tooltip="Go to the API"',
+)
+
+REGEX = re.compile(
+    r'\s*(?:(?P<key>[a-zA-Z0-9_]+)\s*\=)?\s*(?P<value>".*"|[^,]+)\s*(?:,|$)'
+)
+
+
+def eval_literal(string):
+    try:
+        value = literal_eval(string)
+    except Exception:
+        value = string
+    return value
+
+
+def regex_to_func_inputs(text):
+    """The original parser."""
+    args = []
+    kwargs = {}
+    for key, value in REGEX.findall(text):
+        if key:
+            kwargs[key.strip()] = eval_literal(value.strip())
+        else:
+            args.append(eval_literal(value.strip()))
+    return args, kwargs
+
+
+def uncached_to_func_inputs(text):
+    utils.parse_func_inputs.cache_clear()
+    return utils.string_to_func_inputs(text)
+
+
+PARSERS = {
+    "regex": regex_to_func_inputs,
+    "tokenizer": uncached_to_func_inputs,
+    "cached": utils.string_to_func_inputs,
+}
+
+
+def time_parser(parser, texts, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        utils.parse_func_inputs.cache_clear()
+        start = perf_counter()
+        for text in texts:
+            parser(text)
+        timings.append(perf_counter() - start)
+    return min(timings)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("-n", "--number", type=int, default=10000)
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument(
+        "-l", "--length", type=int, default=2000, help="Length of the quoted input"
+    )
+    options = parser.parse_args(args)
+    texts = random.Random(0).choices(INPUTS, k=options.number)
+    long_text = 'check, classes="' + "a," * (options.length // 2) + '"' + ",b=1" * 50
+
+    print(f"{'parser':10} {'per role':>10} {'long input':>12}")
+    for name, func in PARSERS.items():
+        seconds = time_parser(func, texts, options.repeat)
+        long_seconds = time_parser(func, [long_text], options.repeat)
+        print(
+            f"{name:10} {seconds / options.number * 1e6:8.2f}us "
+            f"{long_seconds * 1e6:10.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""Benchmark sphinx-panels against a synthetic corpus.
+
+Usage::
+
+    python benchmarks/run.py run -n 100 -m 5 -d 2 -o results.json
+    python benchmarks/run.py compare baseline.json results.json
+
+``run`` generates a project (see ``corpus.py``), builds it to HTML
+and records the phase timings, the time spent in each sphinx-panels directive
+and post-transform, the peak memory, the size of the outputs
+and the time to load the pickled environment and doctrees.
+``compare`` flags any metric that grew by more than ``--threshold``
+relative to a stored baseline, and exits with a non-zero code if any did.
+"""
+import argparse
+from collections import defaultdict
+from contextlib import contextmanager
+import importlib
+from io import StringIO
+import json
+import pickle
+from pathlib import Path
+import platform
+import sys
+import tempfile
+from time import perf_counter
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+from corpus import add_corpus_arguments, generate_corpus
+
+# (phase, module, class, method) of the sphinx-panels code paths to time
+INSTRUMENTED = (
+    ("directive", "sphinx_panels.panels", "Panels", "run"),
+    ("directive", "sphinx_panels.tabs", "TabbedDirective", "run"),
+    ("directive", "sphinx_panels.dropdown", "DropdownDirective", "run"),
+    ("post_transform", "sphinx_panels.transforms", "PanelsHtmlTransform", "run"),
+)
+
+
+class Timings:
+    """Accumulate call counts and wall time per instrumented function."""
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.seconds = defaultdict(float)
+
+    def wrap(self, key, func):
+        def _wrapped(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.seconds[key] += perf_counter() - start
+                self.counts[key] += 1
+
+        return _wrapped
+
+    @contextmanager
+    def instrument(self):
+        patched = []
+        for phase, module_name, cls_name, method in INSTRUMENTED:
+            cls = getattr(importlib.import_module(module_name), cls_name)
+            original = cls.__dict__[method]
+            key = f"{phase}.{cls_name}.{method}"
+            setattr(cls, method, self.wrap(key, original))
+            patched.append((cls, method, original))
+        try:
+            yield self
+        finally:
+            for cls, method, original in patched:
+                setattr(cls, method, original)
+
+
+def directory_size(path: Path, pattern: str) -> int:
+    return sum(p.stat().st_size for p in Path(path).glob(pattern) if p.is_file())
+
+
+def load_seconds(path: Path, pattern: str) -> float:
+    """Time unpickling the files, as sphinx does on an incremental build."""
+    start = perf_counter()
+    for filepath in Path(path).glob(pattern):
+        with open(filepath, "rb") as handle:
+            pickle.load(handle)
+    return perf_counter() - start
+
+
+def build(srcdir: Path, builddir: Path, timings: Timings, trace_memory: bool):
+    """Build ``srcdir`` to HTML, returning the phase metrics."""
+    from sphinx.application import Sphinx
+
+    marks = {}
+
+    def mark(name):
+        def _callback(*args):
+            marks[name] = perf_counter()
+
+        return _callback
+
+    app = Sphinx(
+        str(srcdir),
+        str(srcdir),
+        str(builddir / "html"),
+        str(builddir / "doctrees"),
+        "html",
+        status=None,
+        warning=StringIO(),
+        freshenv=True,
+    )
+    app.connect("env-before-read-docs", mark("read_start"))
+    app.connect("env-updated", mark("read_end"))
+    app.connect("build-finished", mark("write_end"))
+
+    if trace_memory:
+        tracemalloc.start()
+    start = perf_counter()
+    with timings.instrument():
+        app.build()
+    end = perf_counter()
+    metrics = {
+        "total_seconds": end - start,
+        "read_seconds": marks["read_end"] - marks["read_start"],
+        "write_seconds": marks["write_end"] - marks["read_end"],
+    }
+    if trace_memory:
+        metrics["peak_traced_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    metrics["doctree_bytes"] = directory_size(builddir / "doctrees", "*.doctree")
+    metrics["env_load_seconds"] = load_seconds(
+        builddir / "doctrees", "environment.pickle"
+    )
+    metrics["doctree_load_seconds"] = load_seconds(builddir / "doctrees", "*.doctree")
+    metrics["html_bytes"] = directory_size(builddir / "html", "**/*.html")
+    metrics["warnings"] = len(app._warning.getvalue().splitlines())
+    return metrics
+
+
+def run_benchmark(
+    documents=10, directives=5, depth=2, repeat=1, trace_memory=False, source=None
+):
+    """Run the benchmark, returning the results as a JSON-serialisable dict."""
+    import docutils
+    import sphinx
+    import sphinx_panels
+
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "sphinx": sphinx.__display_version__,
+            "docutils": docutils.__version__,
+            "sphinx_panels": sphinx_panels.__version__,
+        },
+        "corpus": {"documents": documents, "directives": directives, "depth": depth},
+        "metrics": {},
+        "counts": {},
+    }
+    with tempfile.TemporaryDirectory() as tempdir:
+        srcdir = Path(source) if source else Path(tempdir) / "src"
+        if not source:
+            generate_corpus(srcdir, documents, directives, depth)
+        runs = []
+        for index in range(repeat):
+            timings = Timings()
+            metrics = build(
+                srcdir, Path(tempdir) / f"build{index}", timings, trace_memory
+            )
+            for key, value in timings.seconds.items():
+                metrics[f"{key}.seconds"] = value
+            runs.append(metrics)
+            results["counts"] = dict(timings.counts)
+        # take the fastest of the repeats for timings, sizes are deterministic
+        for key in runs[0]:
+            if key.endswith("seconds"):
+                results["metrics"][key] = min(run[key] for run in runs)
+            else:
+                results["metrics"][key] = runs[-1][key]
+    if resource is not None:
+        # kilobytes on Linux, bytes on macOS
+        results["metrics"]["peak_rss"] = resource.getrusage(
+            resource.RUSAGE_SELF
+        ).ru_maxrss
+    return results
+
+
+def compare_results(baseline: dict, current: dict, threshold: float = 0.1):
+    """Return ``(key, baseline, current, ratio)`` for every metric that regressed."""
+    regressions = []
+    for key, old in baseline["metrics"].items():
+        new = current["metrics"].get(key)
+        if new is None or not old:
+            continue
+        ratio = new / old
+        if ratio > 1 + threshold:
+            regressions.append((key, old, new, ratio))
+    return regressions
+
+
+def print_results(results: dict, stream=sys.stdout):
+    width = max(len(key) for key in results["metrics"])
+    for key, value in sorted(results["metrics"].items()):
+        count = results["counts"].get(key.rsplit(".", 1)[0])
+        suffix = f" ({count} calls)" if count is not None else ""
+        if isinstance(value, float):
+            stream.write(f"{key:<{width}}  {value:12.4f}{suffix}\n")
+        else:
+            stream.write(f"{key:<{width}}  {value:12d}{suffix}\n")
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmark")
+    add_corpus_arguments(run_parser)
+    run_parser.add_argument(
+        "-s", "--source", help="Benchmark an existing project instead of a corpus"
+    )
+    run_parser.add_argument(
+        "-r", "--repeat", type=int, default=1, help="Number of builds to time"
+    )
+    run_parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Record peak Python allocations with tracemalloc (slows the build)",
+    )
+    run_parser.add_argument("-o", "--output", type=Path, help="Write results to JSON")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two results")
+    compare_parser.add_argument("baseline", type=Path)
+    compare_parser.add_argument("current", type=Path)
+    compare_parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative increase flagged as a regression (default: 0.1)",
+    )
+
+    options = parser.parse_args(args)
+
+    if options.command == "run":
+        results = run_benchmark(
+            options.documents,
+            options.directives,
+            options.depth,
+            options.repeat,
+            options.trace_memory,
+            options.source,
+        )
+        print_results(results)
+        if options.output:
+            options.output.write_text(json.dumps(results, indent=2), encoding="utf8")
+        return 0
+
+    baseline = json.loads(options.baseline.read_text(encoding="utf8"))
+    current = json.loads(options.current.read_text(encoding="utf8"))
+    regressions = compare_results(baseline, current, options.threshold)
+    for key, old, new, ratio in regressions:
+        print(f"REGRESSION {key}: {old:.4g} -> {new:.4g} ({ratio - 1:+.1%})")
+    if not regressions:
+        print("No regressions found")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+"""Time the sphinx-panels HTML post-transforms, per document, on large documents.
+
+Usage::
+
+    python benchmarks/transforms.py -m 70 -d 3 -r 20
+
+A single document (see ``corpus.py``) is built to HTML once,
+then its pickled doctree is loaded ``repeat`` times, and the time to apply
+the sphinx-panels post-transforms to it is recorded (the minimum is reported).
+Only the post-transforms registered by the extension are timed,
+so the same script can be used to compare against earlier versions.
+"""
+import argparse
+from io import StringIO
+from pathlib import Path
+import tempfile
+from time import perf_counter
+
+from corpus import generate_corpus
+
+DOCNAME = "doc00000"
+
+
+def count_nodes(doctree) -> int:
+    return len(doctree.traverse())
+
+
+def time_transforms(directives: int, depth: int, repeat: int) -> dict:
+    from sphinx.application import Sphinx
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        srcdir = generate_corpus(Path(tempdir) / "src", 1, directives, depth)
+        builddir = Path(tempdir) / "build"
+        app = Sphinx(
+            str(srcdir),
+            str(srcdir),
+            str(builddir / "html"),
+            str(builddir / "doctrees"),
+            "html",
+            status=None,
+            warning=StringIO(),
+            freshenv=True,
+        )
+        app.build()
+        transforms = [
+            cls
+            for cls in app.registry.get_post_transforms()
+            if cls.__module__.startswith("sphinx_panels")
+        ]
+        timings = []
+        for _ in range(repeat):
+            doctree = app.env.get_doctree(DOCNAME)
+            nodes_before = count_nodes(doctree)
+            app.env.temp_data["docname"] = DOCNAME
+            start = perf_counter()
+            for cls in transforms:
+                cls(doctree).apply()
+            timings.append(perf_counter() - start)
+        return {
+            "transforms": [cls.__name__ for cls in transforms],
+            "nodes": nodes_before,
+            "seconds": min(timings),
+        }
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "-m",
+        "--directives",
+        type=int,
+        default=70,
+        help="Number of directives of each kind in the document",
+    )
+    parser.add_argument(
+        "-d", "--depth", type=int, default=3, help="Nesting depth of tabs/dropdowns"
+    )
+    parser.add_argument("-r", "--repeat", type=int, default=20)
+    options = parser.parse_args(args)
+    result = time_transforms(options.directives, options.depth, options.repeat)
+    print(f"post-transforms: {', '.join(result['transforms'])}")
+    print(f"doctree nodes:   {result['nodes']}")
+    print(f"per document:    {result['seconds'] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
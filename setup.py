@@ -38,6 +38,9 @@ setup(
             "sphinx-book-theme~=0.0.36",
             "myst-parser~=0.12.9",
         ],
+        "images": ["pillow"],
+        "compress": ["brotli"],
+        "data": ["pyyaml"],
         "code_style": ["pre-commit~=2.7.0"],
         "testing": ["pytest~=6.0.1", "pytest-regressions~=2.0.1"],
         "live-dev": ["sphinx-autobuild", "web-compile~=0.2.0"],
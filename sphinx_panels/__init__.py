@@ -1,6 +1,9 @@
 """"A sphinx extension to add a ``panels`` directive."""
+from functools import lru_cache, partial
 import hashlib
-from pathlib import Path
+import os
+import re
+from typing import List
 
 try:
     import importlib.resources as resources
@@ -9,23 +12,51 @@ except ImportError:
     import importlib_resources as resources
 
 from docutils import nodes
-from docutils.parsers.rst import directives, Directive
+from docutils.parsers.rst import directives
 from sphinx.application import Sphinx
 from sphinx.environment import BuildEnvironment
+from sphinx.util.docutils import SphinxDirective
 from sphinx.util.logging import getLogger
 
-from .button import setup_link_button
-from .dropdown import setup_dropdown
-from .panels import setup_panels
-from .tabs import setup_tabs
+from .assets import (
+    LOADER_NAME,
+    MANIFEST_NAME,
+    STATIC_DIR,
+    add_css_file,
+    add_panels_css_file,
+    get_static_path,
+    sync_static_assets,
+)
+from .bootstrap import setup_bootstrap
+from .containers import div, setup_containers
+from .lazy import (
+    BUILDER_SETUP,
+    DIRECTIVES,
+    HTML_SETUP,
+    ROLES,
+    USAGE_SETUP,
+    import_object,
+    lazy_class,
+    lazy_function,
+)
+from .usage import note_usage, setup_usage
+from .utils import intern_classes
 from .icons import setup_icons
 
 from . import _css as css_module
+from . import _js as js_module
 
 __version__ = "0.6.0"
 
 LOGGER = getLogger(__name__)
 
+# the scripts, written with a hash in their name, and when they are used:
+# (config value to use it for all of the component, component, component option)
+SCRIPTS = {
+    "panels-tabs.js": ("panels_tabs_lazy", "tabbed", "tabbed-lazy"),
+    "panels-dropdowns.js": ("panels_defer_dropdowns", "dropdown", "dropdown-defer"),
+}
+
 
 def get_default_css_variables():
     return {
@@ -47,19 +78,25 @@ def update_css(app: Sphinx):
         else:
             css_variables[key] = value
 
-    # reset css changed attribute
-    app.env.panels_css_changed = False
-
     # setup up new static path in output dir
-    static_path = (Path(app.outdir) / "_panels_static").absolute()
+    static_path = get_static_path(app)
     static_path.mkdir(exist_ok=True)
     app.config.html_static_path.append(str(static_path))
+    if getattr(app.builder, "embedded", False):
+        # the manifest is in the output directory, which epub packages
+        app.config.epub_exclude_files = app.config.epub_exclude_files + [
+            os.path.join(STATIC_DIR, MANIFEST_NAME)
+        ]
 
-    # record current resources
-    old_resources = {path.name for path in static_path.glob("*") if path.is_file()}
+    # the stylesheets for this build, and those currently linked by the pages
+    app.env.panels_css_files = []
+    if not hasattr(app.env, "panels_css_linked"):
+        app.env.panels_css_linked = None
+    if app.config.panels_css_loader:
+        add_css_file(app, LOADER_NAME)
 
     # Add core CSS
-    css_files = [r for r in resources.contents(css_module) if r.endswith(".css")]
+    css_files = get_packaged_css()
     if app.config.panels_add_boostrap_css is not None:
         LOGGER.warning(
             "`panels_add_boostrap_css` will be deprecated. Please use"
@@ -67,16 +104,18 @@ def update_css(app: Sphinx):
         )
         app.config.panels_add_bootstrap_css = app.config.panels_add_boostrap_css
 
-    if app.config.panels_add_bootstrap_css is False:
+    if app.config.panels_add_bootstrap_css not in (None, True, False, "used"):
+        LOGGER.warning(
+            "`panels_add_bootstrap_css` should be one of True, False or 'used': "
+            f"{app.config.panels_add_bootstrap_css!r}"
+        )
+    if app.config.panels_add_bootstrap_css in (False, "used"):
+        # for "used", the subset is added by `write_bootstrap_subset`
         css_files = [name for name in css_files if "bootstrap" not in name]
+    assets = {}
     for filename in css_files:
-        app.add_css_file(filename)
-        if not (static_path / filename).exists():
-            content = resources.read_text(css_module, filename)
-            (static_path / filename).write_text(content)
-            app.env.panels_css_changed = True
-        if filename in old_resources:
-            old_resources.remove(filename)
+        add_panels_css_file(app, filename)
+        assets[filename] = partial(resources.read_text, css_module, filename)
 
     # add variables CSS file
     css_lines = [":root {"]
@@ -87,29 +126,144 @@ def update_css(app: Sphinx):
     css_variables_name = (
         f"panels-variables.{hashlib.md5(css_str.encode('utf8')).hexdigest()}.css"
     )
-    app.add_css_file(css_variables_name)
-    if not (static_path / css_variables_name).exists():
-        (static_path / css_variables_name).write_text(css_str)
-        app.env.panels_css_changed = True
-    if css_variables_name in old_resources:
-        old_resources.remove(css_variables_name)
+    add_panels_css_file(app, css_variables_name)
+    assets[css_variables_name] = lambda: css_str
+
+    app.env.panels_css_changed = sync_static_assets(app, "css", assets)
 
-    # remove old resources
-    for name in old_resources:
-        for path in Path(app.outdir).glob(f"**/{name}"):
-            path.unlink()
+
+@lru_cache(1)
+def get_packaged_css() -> List[str]:
+    return sorted(r for r in resources.contents(css_module) if r.endswith(".css"))
 
 
 def update_css_links(app: Sphinx, env: BuildEnvironment):
-    """If CSS has changed, all files must be re-written,
-    to include the correct stylesheets.
+    """If the stylesheets linked by the pages have changed,
+    all files must be re-written, to include the correct stylesheets.
+
+    With ``panels_css_loader``, the pages only link to the (fixed name) loader,
+    so instead only the loader is re-written, even in ``panels_dev_mode``.
     """
-    if env.panels_css_changed and app.config.panels_dev_mode:
+    if app.config.panels_css_loader:
+        content = "\n".join(f'@import url("{name}");' for name in env.panels_css_files)
+        sync_static_assets(
+            app, "loader", {LOADER_NAME: lambda: content}, hashed_names=False
+        )
+        linked = [LOADER_NAME]
+    else:
+        sync_static_assets(app, "loader", {})
+        linked = env.panels_css_files
+
+    if linked != env.panels_css_linked:
+        LOGGER.debug("sphinx-panels CSS links changed; re-writing all files")
+        env.panels_css_linked = linked
+        return list(env.all_docs.keys())
+    if (
+        env.panels_css_changed
+        and app.config.panels_dev_mode
+        and not app.config.panels_css_loader
+    ):
         LOGGER.debug("sphinx-panels CSS changed; re-writing all files")
         return list(env.all_docs.keys())
 
 
-class Div(Directive):
+def uses_script(app: Sphinx, env: BuildEnvironment, script: str) -> bool:
+    config_name, component, option_component = SCRIPTS[script]
+    if app.config[config_name]:
+        option_component = component
+    return any(option_component in used for used in env.panels_usage.values())
+
+
+def write_scripts(app: Sphinx, env: BuildEnvironment):
+    """Write the scripts used by the components, and add them to the pages.
+
+    If a script is added or removed (or its content changes),
+    all documents must be re-written.
+    """
+    if app.builder.format != "html":
+        return
+    assets = {}
+    # builders that embed the pages, like epub, do not defer the dropdown bodies
+    embedded = getattr(app.builder, "embedded", False)
+    for script in SCRIPTS:
+        if not uses_script(app, env, script) or (
+            embedded and script == "panels-dropdowns.js"
+        ):
+            continue
+        content = resources.read_text(js_module, script)
+        digest = hashlib.md5(content.encode("utf8")).hexdigest()
+        filename = script.replace(".js", f".{digest}.js")
+        assets[filename] = partial(str, content)
+        app.add_js_file(filename, defer="defer")
+    sync_static_assets(app, "js", assets)
+
+    linked = sorted(assets)
+    if linked != getattr(env, "panels_scripts", []):
+        env.panels_scripts = linked
+        return list(env.all_docs.keys())
+
+
+def setup_builder_components(app: Sphinx):
+    """Set up the features needed by the builder and turned on in the config,
+    importing their modules.
+    """
+    for path, (config_name, html_only) in BUILDER_SETUP.items():
+        if config_name is not None and not app.config[config_name]:
+            continue
+        if html_only and app.builder.format != "html":
+            continue
+        import_object(path)(app)
+
+
+def setup_used_components(app: Sphinx, env: BuildEnvironment):
+    """Register the post-transforms and nodes of the components used,
+    importing their modules.
+
+    This is called after all documents are read, so before any are written.
+    """
+    used = set().union(*env.panels_usage.values())
+    paths = {USAGE_SETUP[c] for c in used if c in USAGE_SETUP}
+    if app.builder.format == "html":
+        paths.update(HTML_SETUP[c] for c in used if c in HTML_SETUP)
+    for path in sorted(paths):
+        import_object(path)(app)
+
+
+def remove_css_bundles(app: Sphinx, env: BuildEnvironment):
+    """Remove the bundles of a previous build, when they are not written
+    (by ``bundles.write_bundles``).
+    """
+    if app.config.panels_css_bundles and app.builder.format == "html":
+        return
+    env.panels_css_bundles = {}
+    sync_static_assets(app, "bundles", {})
+
+
+def validate_config(app, config):
+    if config.panels_css_bundles and config.panels_css_loader:
+        LOGGER.warning(
+            "`panels_css_loader` is ignored, since `panels_css_bundles` is set"
+        )
+        config.panels_css_loader = False
+    if len(app.config.panels_delimiters) != 3:
+        raise AssertionError(
+            "panels_delimiters config must be of form: (header, body, footer)"
+        )
+    if len(set(app.config.panels_delimiters)) != 3:
+        raise AssertionError("panels_delimiters config must contain unique values")
+    try:
+        app.config.panels_delimiters = tuple(
+            [re.compile(s) for s in app.config.panels_delimiters]
+        )
+    except Exception as err:
+        raise AssertionError(
+            "panels_delimiters config must contain only compilable regexes: {}".format(
+                err
+            )
+        )
+
+
+class Div(SphinxDirective):
     """Same as the ``container`` directive,
     but does not add the ``container`` class in HTML outputs,
     which can interfere with Bootstrap CSS.
@@ -122,7 +276,7 @@ class Div(Directive):
 
     def run(self):
         self.assert_has_content()
-        text = "\n".join(self.content)
+        note_usage(self.env, "div")
         try:
             if self.arguments:
                 classes = directives.class_option(self.arguments[0])
@@ -133,8 +287,9 @@ class Div(Directive):
                 'Invalid class attribute value for "%s" directive: "%s".'
                 % (self.name, self.arguments[0])
             )
-        node = nodes.container(text, is_div=True)
-        node["classes"].extend(classes)
+        # the content is not kept as the node's raw source,
+        # since it is already in its children
+        node = div(classes=list(intern_classes(classes)))
         self.add_name(node)
         self.state.nested_parse(self.content, self.content_offset, node)
         return [node]
@@ -142,7 +297,7 @@ class Div(Directive):
 
 def visit_container(self, node: nodes.Node):
     classes = "docutils container"
-    if node.get("is_div", False):
+    if isinstance(node, div) or node.get("is_div", False):
         # we don't want the CSS for container for these nodes
         classes = "docutils"
     self.body.append(self.starttag(node, "div", CLASS=classes))
@@ -154,23 +309,57 @@ def depart_container(self, node: nodes.Node):
 
 def setup(app: Sphinx):
     app.add_directive("div", Div)
-    app.add_config_value("panels_add_bootstrap_css", None, "env")
-    app.add_config_value("panels_add_boostrap_css", None, "env")
-    app.add_config_value("panels_css_variables", {}, "env")
-    app.add_config_value("panels_dev_mode", False, "env")
+    # changes to these values are handled by `update_css_links` and `setup_usage`
+    app.add_config_value("panels_add_bootstrap_css", None, "")
+    app.add_config_value("panels_add_boostrap_css", None, "")
+    # changes to the variables are handled by `update_css_links`
+    app.add_config_value("panels_css_variables", {}, "")
+    app.add_config_value("panels_css_loader", False, "html")
+    app.add_config_value("panels_dev_mode", False, "")
     app.connect("builder-inited", update_css)
-    app.connect("env-updated", update_css_links)
     # we override container html visitors, to stop the default behaviour
     # of adding the `container` class to all nodes.container
     app.add_node(
         nodes.container, override=True, html=(visit_container, depart_container)
     )
+    setup_containers(app)
+
+    app.add_config_value(
+        "panels_delimiters", (r"^\-{3,}$", r"^\^{3,}$", r"^\+{3,}$"), ""
+    )
+    app.add_config_value("panels_dropdown_css_markers", False, "")
+    # the scripts for these values are added by `write_scripts`
+    app.add_config_value("panels_tabs_lazy", False, "html")
+    app.connect("config-inited", validate_config)
+    for name, path in DIRECTIVES.items():
+        app.add_directive(name, lazy_class(path))
+    for name, path in ROLES.items():
+        app.add_role(name, lazy_function(path))
+
+    # the features of these values are set up by `setup_builder_components`
+    app.add_config_value("panels_css_bundles", False, "html")
+    app.add_config_value("panels_css_critical", False, "html")
+    app.add_config_value("panels_defer_dropdowns", False, "html")
+    app.add_config_value("panels_img_lazy", True, "html")
+    app.add_config_value("panels_img_priority", 2, "html")
+    app.add_config_value("panels_img_srcset", [], "html", types=(list, tuple))
+    app.add_config_value(
+        "panels_img_srcset_sizes", "(min-width: 576px) 50vw, 100vw", "html"
+    )
+    app.add_config_value("panels_profile", False, "")
+    app.add_config_value("panels_profile_top", 10, "")
+    app.add_config_value("panels_profile_memory", False, "")
 
-    setup_panels(app)
-    setup_link_button(app)
-    setup_dropdown(app)
-    setup_tabs(app)
+    setup_usage(app)
+    setup_bootstrap(app)
     setup_icons(app)
+    app.connect("builder-inited", setup_builder_components)
+    app.connect("env-updated", setup_used_components)
+    app.connect("env-updated", write_scripts)
+    app.connect("env-updated", remove_css_bundles)
+    # after the other CSS is added, by `write_bootstrap_subset`,
+    # and split into bundles, by `bundles.write_bundles`
+    app.connect("env-updated", update_css_links, priority=600)
 
     return {
         "version": __version__,
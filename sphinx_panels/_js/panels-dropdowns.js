@@ -0,0 +1,73 @@
+// Load the deferred bodies of the sphinx-panels dropdowns,
+// the first time they are opened.
+// The bodies of a page are in a fragment file next to it, fetched once.
+(function () {
+  "use strict";
+
+  var fragments = {};
+
+  function getFragments(url) {
+    if (!fragments[url]) {
+      fragments[url] = fetch(url)
+        .then(function (response) {
+          if (!response.ok) {
+            throw new Error(response.status + " " + response.statusText);
+          }
+          return response.text();
+        })
+        .then(function (text) {
+          return new DOMParser().parseFromString(text, "text/html");
+        });
+      // allow a retry, the next time a dropdown is opened
+      fragments[url].catch(function () {
+        delete fragments[url];
+      });
+    }
+    return fragments[url];
+  }
+
+  function loadBody(placeholder) {
+    if (placeholder.hasAttribute("data-loading")) {
+      return;
+    }
+    placeholder.setAttribute("data-loading", "");
+    var url = placeholder.getAttribute("data-fragment-url");
+    var id = placeholder.getAttribute("data-fragment-id");
+    getFragments(url).then(
+      function (fragment) {
+        var body = fragment.getElementById(id);
+        var parent = placeholder.parentNode;
+        while (body && body.firstChild) {
+          parent.insertBefore(document.adoptNode(body.firstChild), placeholder);
+        }
+        parent.removeChild(placeholder);
+      },
+      function (error) {
+        placeholder.removeAttribute("data-loading");
+        // e.g. pages opened from the file system, link to the body instead
+        var link = document.createElement("a");
+        link.href = url + "#" + id;
+        link.textContent = "Show content";
+        placeholder.replaceChildren(link);
+        console.warn("sphinx-panels: could not load " + url, error);
+      }
+    );
+  }
+
+  // toggle events do not bubble, so they are captured
+  document.addEventListener(
+    "toggle",
+    function (event) {
+      var details = event.target;
+      if (details.tagName !== "DETAILS" || !details.open) {
+        return;
+      }
+      var content = details.querySelector(":scope > .summary-content");
+      var placeholder = content && content.firstElementChild;
+      if (placeholder && placeholder.classList.contains("panels-deferred")) {
+        loadBody(placeholder);
+      }
+    },
+    true
+  );
+})();
@@ -0,0 +1,36 @@
+// Add the content of the lazy sphinx-panels tabs to the page,
+// the first time their tab is selected.
+// The content is in a <template>, followed by a <noscript> link to a copy
+// in the page's fragment file, for when JavaScript is off.
+(function () {
+  "use strict";
+
+  function renderTab(input) {
+    var label = input.nextElementSibling;
+    var content = label && label.nextElementSibling;
+    var template = content && content.firstElementChild;
+    if (!template || template.tagName !== "TEMPLATE") {
+      return;
+    }
+    content.replaceChild(template.content, template);
+  }
+
+  document.addEventListener("change", function (event) {
+    var input = event.target;
+    var parent = input.parentElement;
+    if (parent && parent.classList.contains("tabbed-set")) {
+      renderTab(input);
+    }
+  });
+
+  // browsers may restore the selected tabs, e.g. when going back to a page
+  function renderChecked() {
+    var inputs = document.querySelectorAll(".tabbed-set > input:checked");
+    Array.prototype.forEach.call(inputs, renderTab);
+  }
+  if (document.readyState === "loading") {
+    document.addEventListener("DOMContentLoaded", renderChecked);
+  } else {
+    renderChecked();
+  }
+})();
@@ -0,0 +1,217 @@
+"""Write the static assets of sphinx-panels to ``<outdir>/_panels_static``.
+
+The written files are tracked in a manifest, so that old files can be removed,
+and unchanged files skipped, without listing or reading the output directory.
+Asset names generally contain a hash of their content,
+so a file recorded in the manifest is known to be up-to-date.
+
+Hashed text assets are also written precompressed, as ``<name>.gz``
+and (if ``brotli`` is installed) ``<name>.br``, for servers that can serve them.
+Their sizes are listed in ``panels-assets.json``, which deployment tools can use
+to set long-lived cache headers for these (immutable) assets.
+"""
+import gzip
+import hashlib
+import json
+import os
+from pathlib import Path
+import tempfile
+from typing import Callable, Dict, Tuple, Union
+
+from sphinx.application import Sphinx
+from sphinx.util.logging import getLogger
+
+LOGGER = getLogger(__name__)
+
+STATIC_DIR = "_panels_static"
+# files starting with "." are not copied to `_static` by sphinx
+MANIFEST_NAME = ".panels-manifest.json"
+# the public list of the hashed assets
+ASSETS_LIST_NAME = "panels-assets.json"
+# the encodings the hashed assets are precompressed with, and their suffixes
+ENCODINGS = {"gzip": ".gz", "br": ".br"}
+COMPRESS_SUFFIXES = (".css", ".js", ".svg")
+# the fixed name stylesheet, that imports the hashed stylesheets
+LOADER_NAME = "sphinx-panels.css"
+# the attributes of a stylesheet ``<link>``, so that it does not block rendering
+ASYNC_CSS_ATTRIBUTES = {"media": "print", "onload": "this.media='all'"}
+
+
+def get_static_path(app: Sphinx) -> Path:
+    return (Path(app.outdir) / STATIC_DIR).absolute()
+
+
+def add_css_file(app: Sphinx, filename: str):
+    """Add a stylesheet to all pages, loaded asynchronously with
+    ``panels_css_critical`` (see ``critical.py``).
+    """
+    if app.config.panels_css_critical:
+        app.add_css_file(filename, **ASYNC_CSS_ATTRIBUTES)
+    else:
+        app.add_css_file(filename)
+
+
+def add_panels_css_file(app: Sphinx, filename: str):
+    """Add a stylesheet to all pages or, with ``panels_css_loader``,
+    to the imports of the loader stylesheet.
+
+    With ``panels_css_bundles``, the stylesheets are instead split into bundles,
+    which are linked by the pages that use them (see ``bundles.py``).
+    """
+    app.env.panels_css_files.append(filename)
+    if not (app.config.panels_css_loader or app.config.panels_css_bundles):
+        add_css_file(app, filename)
+
+
+def read_manifest(static_path: Path) -> dict:
+    try:
+        return json.loads((static_path / MANIFEST_NAME).read_text(encoding="utf8"))
+    except (OSError, ValueError):
+        return {}
+
+
+def remove_asset(app: Sphinx, name: str, encodings=ENCODINGS):
+    """Remove an asset and its compressed variants,
+    and the copies sphinx makes in the output static folder.
+    """
+    LOGGER.debug(f"removing old sphinx-panels asset: {name}")
+    for filename in [name] + [name + ENCODINGS[e] for e in encodings]:
+        for path in (
+            get_static_path(app) / filename,
+            Path(app.outdir) / "_static" / filename,
+        ):
+            if path.exists():
+                path.unlink()
+
+
+def write_atomic(path: Path, content: bytes):
+    """Write to a temporary file, then move it into place,
+    so that a partially written file is never left at ``path``.
+    """
+    handle, temp_path = tempfile.mkstemp(dir=str(path.parent), prefix=".tmp-")
+    try:
+        with os.fdopen(handle, "wb") as temp_file:
+            temp_file.write(content)
+        os.replace(temp_path, str(path))
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def write_asset(app: Sphinx, name: str, content: bytes):
+    write_atomic(get_static_path(app) / name, content)
+    # sphinx only copies static files when pages are written,
+    # so also update any existing copy, for builds where no pages change
+    copy_path = Path(app.outdir) / "_static"
+    if copy_path.is_dir():
+        write_atomic(copy_path / name, content)
+
+
+def get_encodings(name: str) -> Tuple[str, ...]:
+    """Return the encodings to precompress a hashed asset with."""
+    if not name.endswith(COMPRESS_SUFFIXES):
+        return ()
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return ("gzip",)
+    return ("gzip", "br")
+
+
+def compress(content: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        import brotli
+
+        return brotli.compress(content)
+    # a fixed mtime, so that the output is reproducible
+    return gzip.compress(content, compresslevel=9, mtime=0)
+
+
+def write_assets_list(app: Sphinx, manifest: dict):
+    """Write the list of hashed assets, with their (compressed) sizes."""
+    assets = {
+        name: {"md5": record["md5"], "size": record["size"], **record["encodings"]}
+        for name, record in sorted(manifest.items())
+        if "encodings" in record
+    }
+    write_asset(
+        app, ASSETS_LIST_NAME, json.dumps(assets, indent=1).encode("utf8") + b"\n"
+    )
+
+
+def sync_static_assets(
+    app: Sphinx,
+    group: str,
+    assets: Dict[str, Callable[[], Union[str, bytes]]],
+    hashed_names: bool = True,
+) -> bool:
+    """Ensure the assets of a group are written, and remove its old assets.
+
+    :param group: a name for the set of assets, e.g. ``css``,
+        so that assets written by different hooks do not remove each other
+    :param assets: mapping of file name to a function returning its content
+        (text, or bytes for binary files),
+        which is only called if the file needs to be written
+    :param hashed_names: whether the names contain a hash of the content,
+        otherwise the content is always generated, and compared to the manifest
+
+    :returns: whether any files were written or removed
+    """
+    static_path = get_static_path(app)
+    static_path.mkdir(exist_ok=True)
+    if (static_path / MANIFEST_NAME).exists():
+        manifest = read_manifest(static_path)
+    else:
+        # files written before the manifest existed are unknown, so remove them
+        manifest = {}
+        for path in static_path.iterdir():
+            if path.is_file():
+                remove_asset(app, path.name)
+    changed = False
+    # builders that package the files, like epub, do not serve them
+    precompress = not getattr(getattr(app, "builder", None), "embedded", False)
+
+    for name, get_content in assets.items():
+        record = manifest.get(name)
+        exists = record and record["group"] == group and (static_path / name).exists()
+        encodings = get_encodings(name) if hashed_names and precompress else ()
+        # the variants are re-written if, e.g., brotli has been installed
+        if (
+            exists
+            and hashed_names
+            and sorted(record.get("encodings", ())) == sorted(encodings)
+        ):
+            continue
+        content = get_content()
+        if isinstance(content, str):
+            content = content.encode("utf8")
+        digest = hashlib.md5(content).hexdigest()
+        if exists and not hashed_names and record["md5"] == digest:
+            continue
+        if exists:
+            remove_asset(app, name, record.get("encodings", ()))
+        write_asset(app, name, content)
+        manifest[name] = {"group": group, "md5": digest, "size": len(content)}
+        if hashed_names:
+            manifest[name]["encodings"] = {}
+            for encoding in encodings:
+                compressed = compress(content, encoding)
+                write_asset(app, name + ENCODINGS[encoding], compressed)
+                manifest[name]["encodings"][encoding] = len(compressed)
+        changed = True
+
+    for name in [n for n, r in manifest.items() if r["group"] == group]:
+        if name in assets:
+            continue
+        remove_asset(app, name, manifest[name].get("encodings", ()))
+        manifest.pop(name)
+        changed = True
+
+    if changed:
+        write_atomic(
+            static_path / MANIFEST_NAME,
+            json.dumps(manifest, indent=1, sort_keys=True).encode("utf8"),
+        )
+    if precompress and (changed or not (static_path / ASSETS_LIST_NAME).exists()):
+        write_assets_list(app, manifest)
+    return changed
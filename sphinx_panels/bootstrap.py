@@ -0,0 +1,114 @@
+"""Write a subset of the Bootstrap CSS, containing only the classes used in the build.
+
+This is used when ``panels_add_bootstrap_css = "used"``.
+"""
+import hashlib
+
+try:
+    import importlib.resources as resources
+except ImportError:
+    # python < 3.7
+    import importlib_resources as resources
+
+from docutils import nodes
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.util.nodes import NodeMatcher
+
+from . import _css as css_module
+from .assets import add_panels_css_file, sync_static_assets
+from .containers import card_region, panel_card
+from .utils import prune_css
+
+# classes added by PanelsHtmlTransform, after the doctrees are read
+TRANSFORM_CLASSES = (
+    "sphinx-bs",
+    "dropdown",
+    "card",
+    "summary-title",
+    "card-header",
+    "summary-content",
+    "card-body",
+    "card-text",
+)
+REGION_CLASSES = ("card-text", "card-title")
+
+
+def setup_bootstrap(app: Sphinx):
+    app.connect("builder-inited", init_classes)
+    app.connect("doctree-read", collect_classes)
+    app.connect("env-purge-doc", purge_classes)
+    app.connect("env-merge-info", merge_classes)
+    app.connect("env-updated", write_bootstrap_subset)
+
+
+def use_subset(app: Sphinx) -> bool:
+    return app.config.panels_add_bootstrap_css == "used"
+
+
+def collects_classes(config) -> bool:
+    """Whether the classes used by each document are collected,
+    for the Bootstrap subset, or the critical CSS of each page.
+    """
+    return config.panels_add_bootstrap_css == "used" or config.panels_css_critical
+
+
+def init_classes(app: Sphinx):
+    if not hasattr(app.env, "panels_classes"):
+        app.env.panels_classes = {}
+
+
+def collect_classes(app: Sphinx, doctree: nodes.document):
+    """Record the classes used in the document.
+
+    This includes all classes in the doctree (not only those on sphinx-panels nodes),
+    since it is cheap, and ensures no required rules are pruned.
+    """
+    if not collects_classes(app.config):
+        return
+    classes = set()
+    for node in doctree.traverse(nodes.Element):
+        classes.update(node["classes"])
+        if isinstance(node, card_region):
+            classes.update(REGION_CLASSES)
+        elif isinstance(node, panel_card):
+            classes.update(node["column_classes"])
+    for node in doctree.traverse(NodeMatcher(nodes.container, type="dropdown")):
+        for key in ("container_classes", "title_classes", "body_classes"):
+            classes.update(node[key])
+        classes.update(TRANSFORM_CLASSES)
+    app.env.panels_classes[app.env.docname] = classes
+
+
+def purge_classes(app: Sphinx, env: BuildEnvironment, docname: str):
+    env.panels_classes.pop(docname, None)
+
+
+def merge_classes(app: Sphinx, env: BuildEnvironment, docnames, other):
+    for docname in docnames:
+        if docname in other.panels_classes:
+            env.panels_classes[docname] = other.panels_classes[docname]
+
+
+def get_bootstrap_resource() -> str:
+    return next(
+        name
+        for name in resources.contents(css_module)
+        if name.startswith("panels-bootstrap.") and name.endswith(".css")
+    )
+
+
+def write_bootstrap_subset(app: Sphinx, env: BuildEnvironment):
+    """Write the subset of the Bootstrap CSS, for the classes used in all documents."""
+    if not use_subset(app):
+        sync_static_assets(app, "bootstrap", {})
+        return
+    classes = set().union(*env.panels_classes.values())
+    content = prune_css(
+        resources.read_text(css_module, get_bootstrap_resource()), classes
+    )
+    digest = hashlib.md5(content.encode("utf8")).hexdigest()
+    filename = f"panels-bootstrap.{digest}.css"
+    sync_static_assets(app, "bootstrap", {filename: lambda: content})
+    # re-writing pages for a changed file name is handled by `update_css_links`
+    add_panels_css_file(app, filename)
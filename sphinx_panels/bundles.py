@@ -0,0 +1,155 @@
+"""Split the sphinx-panels stylesheets into per-component bundles,
+and link each page only to the bundles of the components it uses.
+
+This is used when ``panels_css_bundles = True``.
+The stylesheets are split by the classes of their selectors, once all documents
+are read, and the components used by each document are those recorded by
+``usage.note_usage`` (so pages without any components link to no bundles).
+"""
+from functools import partial
+import hashlib
+from typing import Dict, Iterable, List
+
+from sphinx.application import Sphinx
+from sphinx.builders.html import Stylesheet
+from sphinx.environment import BuildEnvironment
+
+from .assets import ASYNC_CSS_ATTRIBUTES, get_static_path, sync_static_assets
+from .utils import iter_css_blocks, selector_classes, split_selectors
+
+# the bundles, in the order they are linked, and the classes of their selectors;
+# a class matches a prefix if it is the same, or starts with the prefix and "-"
+BUNDLES = {
+    "buttons": ("btn", "badge", "stretched-link"),
+    "cards": ("card", "row", "col", "container", "no-gutters"),
+    "utilities": (),
+    "dropdown": ("dropdown", "summary", "fade", "css-markers", "no-title"),
+    "icons": ("octicon",),
+    "tabs": ("tabbed",),
+}
+# the order that selectors are matched to bundles,
+# e.g. ``.dropdown .card-header`` is in the dropdown bundle
+MATCH_ORDER = ("tabs", "icons", "buttons", "dropdown", "cards")
+# the bundles used by each component
+COMPONENT_BUNDLES = {
+    "panels": ("cards", "utilities"),
+    "div": ("cards", "utilities"),
+    "dropdown": ("dropdown", "cards", "utilities"),
+    "link-button": ("buttons", "utilities"),
+    "badge": ("buttons", "utilities"),
+    "link-badge": ("buttons", "utilities"),
+    "opticon": ("icons",),
+    "tabbed": ("tabs",),
+}
+# the bundles of the dropdown markers (opticons), unless they are drawn by CSS
+DROPDOWN_MARKER_BUNDLES = ("icons",)
+
+
+def setup_bundles(app: Sphinx):
+    # before `update_css_links`, which links the bundles' files
+    app.connect("env-updated", write_bundles, priority=550)
+    app.connect("html-page-context", add_bundle_links)
+
+
+def get_selector_bundle(selector: str) -> str:
+    classes = selector_classes(selector)
+    if not classes:
+        # the CSS variables are only used by the tabs
+        return "tabs" if selector == ":root" else "utilities"
+    for bundle in MATCH_ORDER:
+        for cls in classes:
+            for prefix in BUNDLES[bundle]:
+                if cls == prefix or cls.startswith(prefix + "-"):
+                    return bundle
+    return "utilities"
+
+
+def split_css(css: str) -> Dict[str, str]:
+    """Split the CSS into bundles, by the classes of each selector.
+
+    ``@media`` blocks are split by their rules, and ``@keyframes``
+    are added to the bundles that reference them.
+    """
+    rules: Dict[str, List[str]] = {}
+    at_rules = []
+    for prelude, body in iter_css_blocks(css):
+        if body is None:
+            rules.setdefault("utilities", []).append(prelude)
+        elif prelude.startswith(("@media", "@supports")):
+            for bundle, inner in split_css(body).items():
+                rules.setdefault(bundle, []).append(f"{prelude}{{{inner}}}")
+        elif prelude.startswith("@"):
+            at_rules.append((prelude, body))
+        else:
+            selectors: Dict[str, List[str]] = {}
+            for selector in split_selectors(prelude):
+                bundle = get_selector_bundle(selector)
+                selectors.setdefault(bundle, []).append(selector)
+            for bundle, names in selectors.items():
+                rules.setdefault(bundle, []).append(f"{','.join(names)}{{{body}}}")
+    bundles = {bundle: "".join(rules[bundle]) for bundle in BUNDLES if bundle in rules}
+    for prelude, body in at_rules:
+        name = prelude.split()[-1]
+        for bundle, content in bundles.items():
+            if name in content:
+                bundles[bundle] = content + f"{prelude}{{{body}}}"
+    return bundles
+
+
+def write_bundles(app: Sphinx, env: BuildEnvironment):
+    """Write the bundles of the stylesheets, which replace them in the pages."""
+    env.panels_css_bundles = {}
+    static_path = get_static_path(app)
+    css = "".join(
+        (static_path / name).read_text(encoding="utf8") for name in env.panels_css_files
+    )
+    assets = {}
+    for bundle, content in split_css(css).items():
+        digest = hashlib.md5(content.encode("utf8")).hexdigest()
+        filename = f"panels-{bundle}.{digest}.css"
+        assets[filename] = partial(str, content)
+        env.panels_css_bundles[bundle] = filename
+    sync_static_assets(app, "bundles", assets)
+    # re-writing pages for changed file names is handled by `update_css_links`
+    env.panels_css_files = list(env.panels_css_bundles.values())
+
+
+def get_page_css_files(app: Sphinx, docnames: Iterable[str]) -> List[str]:
+    """Return the stylesheets that pages with these documents use."""
+    env = app.env
+    if not env.panels_css_bundles:
+        return env.panels_css_files
+    used = set()
+    css_markers = app.config.panels_dropdown_css_markers
+    for docname in docnames:
+        for component in env.panels_usage.get(docname, ()):
+            used.update(COMPONENT_BUNDLES.get(component, ()))
+            if component == "dropdown" and not css_markers:
+                used.update(DROPDOWN_MARKER_BUNDLES)
+    return [
+        filename
+        for bundle, filename in env.panels_css_bundles.items()
+        if bundle in used
+    ]
+
+
+def get_page_docnames(app: Sphinx, pagename: str, doctree) -> List[str]:
+    """Return the documents that are written to a page."""
+    if app.builder.name == "singlehtml":
+        return list(app.env.all_docs)
+    if doctree is None:
+        return []
+    return [pagename]
+
+
+def add_bundle_links(app: Sphinx, pagename, templatename, context, doctree):
+    """Link the page to the bundles of the components it uses."""
+    if not getattr(app.env, "panels_css_bundles", None):
+        return
+    docnames = get_page_docnames(app, pagename, doctree)
+    attributes = ASYNC_CSS_ATTRIBUTES if app.config.panels_css_critical else {}
+    # a new list, since the context's list is shared by all pages
+    context["css_files"] = list(context.get("css_files", [])) + [
+        Stylesheet("_static/" + filename, **attributes)
+        for filename in get_page_css_files(app, docnames)
+    ]
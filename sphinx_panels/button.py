@@ -3,23 +3,34 @@ from urllib.parse import unquote
 from docutils import nodes
 from docutils.utils import unescape
 from docutils.parsers.rst import directives
-from sphinx import addnodes
 from sphinx.util.docutils import SphinxDirective
 
+from .links import get_xref_role, link_xref
+from .usage import note_usage
 from .utils import string_to_func_inputs
 
 
-def setup_link_button(app):
-    app.add_directive("link-button", LinkButton)
-    # TODO hide badges in non-HTML?
-    app.add_role("badge", badge_role)
-    app.add_role("link-badge", link_badge_role)
+def create_ref_node(link_type, uri, text, tooltip, env=None, role=None):
+    """Create a reference to a URL or, for the ``ref`` type, a cross-reference.
 
-
-def create_ref_node(link_type, uri, text, tooltip):
+    :param role: the role of the cross-reference, e.g. ``doc`` or ``py:class``,
+        otherwise it is resolved as an ``any`` reference
+    """
     innernode = nodes.inline(text, text)
-    if link_type == "ref":
-        ref_node = addnodes.pending_xref(
+    if link_type == "ref" and role:
+        domain, reftype, lowercase = get_xref_role(env, role)
+        target = unquote(uri)
+        ref_node = link_xref(
+            reftarget=target.lower() if lowercase else target,
+            reftype=reftype,
+            refdoc=env.docname,
+            refdomain=domain,
+            refexplicit=True,
+            refwarn=True,
+        )
+        innernode["classes"] = ["xref", domain, f"{domain}-{reftype}"]
+    elif link_type == "ref":
+        ref_node = link_xref(
             reftarget=unquote(uri),
             reftype="any",
             # refdoc=self.env.docname,
@@ -49,21 +60,27 @@ class LinkButton(SphinxDirective):
     final_argument_whitespace = True
     option_spec = {
         "type": lambda arg: directives.choice(arg, ("url", "ref")),
+        "role": directives.unchanged_required,
         "text": directives.unchanged,
         "tooltip": directives.unchanged,
         "classes": directives.unchanged,
     }
 
     def run(self):
+        note_usage(self.env, "link-button")
 
         uri = self.arguments[0]
-        link_type = self.options.get("type", "url")
+        role = self.options.get("role", None)
+        link_type = "ref" if role else self.options.get("type", "url")
 
         text = self.options.get("text", uri)
 
-        ref_node = create_ref_node(
-            link_type, uri, text, self.options.get("tooltip", None)
-        )
+        try:
+            ref_node = create_ref_node(
+                link_type, uri, text, self.options.get("tooltip", None), self.env, role
+            )
+        except ValueError as err:
+            raise self.error(str(err))
         self.set_source_info(ref_node)
         ref_node["classes"] = ["sphinx-bs", "btn", "text-wrap"] + self.options.get(
             "classes", ""
@@ -81,6 +98,7 @@ def get_badge_inputs(text, cls: str = ""):
 
 
 def badge_role(role, rawtext, text, lineno, inliner, options={}, content=[]):
+    note_usage(inliner.document.settings.env, "badge")
     try:
         args, kwargs = string_to_func_inputs(text)
         text, classes = get_badge_inputs(*args, **kwargs)
@@ -96,19 +114,27 @@ def badge_role(role, rawtext, text, lineno, inliner, options={}, content=[]):
     return [node], []
 
 
-def get_link_badge_inputs(link, text=None, type="link", cls: str = "", tooltip=None):
-    return link, text or link, type, cls.split(), tooltip
+def get_link_badge_inputs(
+    link, text=None, type="link", cls: str = "", tooltip=None, role=None
+):
+    if role:
+        type = "ref"
+    return link, text or link, type, cls.split(), tooltip, role
 
 
 def link_badge_role(role, rawtext, text, lineno, inliner, options={}, content=[]):
+    env = inliner.document.settings.env
+    note_usage(env, "link-badge")
     try:
         args, kwargs = string_to_func_inputs(text)
-        uri, text, link_type, classes, tooltip = get_link_badge_inputs(*args, **kwargs)
+        uri, text, link_type, classes, tooltip, role = get_link_badge_inputs(
+            *args, **kwargs
+        )
+        ref_node = create_ref_node(link_type, uri, text, tooltip, env, role)
     except Exception as err:
         msg = inliner.reporter.error(f"badge input is invalid: {err}", line=lineno)
         prb = inliner.problematic(rawtext, rawtext, msg)
         return [prb], [msg]
-    ref_node = create_ref_node(link_type, uri, text, tooltip)
     if lineno is not None:
         ref_node.source, ref_node.line = inliner.reporter.get_source_and_line(lineno)
     ref_node["classes"] = ["sphinx-bs", "badge"] + classes
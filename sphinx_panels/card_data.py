@@ -0,0 +1,85 @@
+"""Read the cards of a ``panels`` directive from a data file (its ``source`` option).
+
+The file is a list of cards, in JSON, YAML (which requires PyYAML)
+or CSV (with a header row), and each card is a mapping of the ``CARD_KEYS``.
+The parsed cards are cached by the hash of the file's content,
+so a file used by several directives, or re-read unchanged, is parsed once.
+"""
+import csv
+import hashlib
+import io
+import json
+from pathlib import Path
+from typing import Dict, Tuple
+
+# the text of the card regions, parsed as inline text
+REGION_KEYS = ("header", "body", "footer")
+# the images, and the data keys of the panel class options
+IMAGE_KEYS = ("img-top", "img-bottom")
+CLASS_KEYS = {
+    "column": "column",
+    "card": "card",
+    "header-cls": "header",
+    "body-cls": "body",
+    "footer-cls": "footer",
+    "img-top-cls": "img-top-cls",
+    "img-bottom-cls": "img-bottom-cls",
+}
+CARD_KEYS = REGION_KEYS + IMAGE_KEYS + tuple(CLASS_KEYS)
+
+# the cards of the data files, by the hash of their content, and their format
+CARDS_CACHE: Dict[Tuple[str, str], Tuple[Dict[str, str], ...]] = {}
+CARDS_CACHE_SIZE = 32
+
+
+def read_records(text: str, suffix: str) -> list:
+    """Read the records of a JSON, YAML or CSV file."""
+    if suffix == ".json":
+        return json.loads(text)
+    if suffix in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(
+                "YAML sources require PyYAML: pip install sphinx-panels[data]"
+            )
+        try:
+            return yaml.safe_load(text)
+        except yaml.YAMLError as err:
+            raise ValueError(str(err))
+    if suffix == ".csv":
+        return list(csv.DictReader(io.StringIO(text)))
+    raise ValueError(f"unknown format {suffix!r} (use .json, .yaml, .yml or .csv)")
+
+
+def parse_cards(text: str, suffix: str) -> Tuple[Dict[str, str], ...]:
+    """Parse the cards of a data file, with their (non-empty) values as strings."""
+    records = read_records(text, suffix)
+    if not isinstance(records, list):
+        raise ValueError("the file must contain a list of cards")
+    cards = []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            raise ValueError(f"card {index} is not a mapping")
+        unknown = sorted(str(key) for key in record if key not in CARD_KEYS)
+        if unknown:
+            raise ValueError(f"card {index} has unknown keys: {unknown}")
+        cards.append(
+            {
+                key: str(value)
+                for key, value in record.items()
+                if value is not None and value != ""
+            }
+        )
+    return tuple(cards)
+
+
+def load_cards(path: Path) -> Tuple[Dict[str, str], ...]:
+    """Return the cards of a data file (which should not be modified)."""
+    content = Path(path).read_bytes()
+    key = (hashlib.md5(content).hexdigest(), Path(path).suffix.lower())
+    if key not in CARDS_CACHE:
+        if len(CARDS_CACHE) >= CARDS_CACHE_SIZE:
+            CARDS_CACHE.pop(next(iter(CARDS_CACHE)))
+        CARDS_CACHE[key] = parse_cards(content.decode("utf-8-sig"), key[1])
+    return CARDS_CACHE[key]
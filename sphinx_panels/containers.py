@@ -0,0 +1,54 @@
+"""The container nodes of the components, as dedicated node types.
+
+These are subclasses of ``nodes.container``, so builders without visitors for them
+fall back to their ``container`` visitors (sphinx dispatches on the class's MRO),
+but their type replaces the attributes that would otherwise be stored
+on every node of the pickled doctrees.
+"""
+from docutils import nodes
+from sphinx.application import Sphinx
+
+
+class div(nodes.container):
+    """A container written as a plain ``<div>``, without the ``container`` class,
+    which can interfere with Bootstrap CSS.
+    """
+
+
+class card_region(div):
+    """The header, body or footer of a panel's card."""
+
+
+class panel_card(div):
+    """A panel's card, written inside the container of its column,
+    with the classes of the ``column_classes`` attribute.
+    """
+
+
+def setup_containers(app: Sphinx):
+    app.add_node(div)
+    app.add_node(card_region)
+    visitors = (visit_panel_card, depart_panel_card)
+    app.add_node(
+        panel_card,
+        html=visitors,
+        latex=visitors,
+        text=visitors,
+        man=visitors,
+        texinfo=visitors,
+    )
+
+
+def get_column(node: panel_card) -> div:
+    return div(classes=list(node["column_classes"]))
+
+
+def visit_panel_card(self, node: panel_card):
+    """Visit the column and the card, as the builder visits containers."""
+    self.visit_container(get_column(node))
+    self.visit_container(node)
+
+
+def depart_panel_card(self, node: panel_card):
+    self.depart_container(node)
+    self.depart_container(get_column(node))
@@ -0,0 +1,80 @@
+"""Inline the CSS rules used by each page, and load the stylesheets asynchronously.
+
+This is used when ``panels_css_critical = True``.
+The classes used by each document are collected when it is read
+(see ``bootstrap.collect_classes``), and the rules of the sphinx-panels stylesheets
+that match them are added to a ``<style>`` in the page's ``<head>``.
+The (cached) stylesheets are then loaded without blocking the first render,
+with a ``<noscript>`` fallback for when JavaScript is off.
+"""
+from functools import lru_cache
+from pathlib import Path
+from typing import FrozenSet, Iterable, Tuple
+
+from sphinx.application import Sphinx
+
+from .assets import LOADER_NAME, get_static_path
+from .bootstrap import TRANSFORM_CLASSES
+from .bundles import get_page_css_files, get_page_docnames
+from .utils import prune_css
+
+# classes added to the HTML of the components, that are not on the read doctrees
+COMPONENT_CLASSES = {
+    "dropdown": TRANSFORM_CLASSES
+    + ("css-markers", "no-title", "summary-down", "summary-up", "octicon"),
+    "tabbed": ("tabbed-set",),
+    "opticon": ("octicon",),
+}
+
+
+def setup_critical_css(app: Sphinx):
+    app.connect("html-page-context", inline_critical_css)
+
+
+@lru_cache(maxsize=None)
+def read_css(path: str) -> str:
+    # the stylesheets have a hash of their content in their name
+    return Path(path).read_text(encoding="utf8")
+
+
+@lru_cache(maxsize=128)
+def get_critical_css(paths: Tuple[str, ...], classes: FrozenSet[str]) -> str:
+    """Return the rules of the stylesheets that can match the classes."""
+    return "".join(prune_css(read_css(path), classes) for path in paths)
+
+
+def get_page_classes(app: Sphinx, docnames: Iterable[str]) -> FrozenSet[str]:
+    env = app.env
+    classes = set()
+    for docname in docnames:
+        classes.update(env.panels_classes.get(docname, ()))
+        for component in env.panels_usage.get(docname, ()):
+            classes.update(COMPONENT_CLASSES.get(component, ()))
+    return frozenset(classes)
+
+
+def inline_critical_css(app: Sphinx, pagename, templatename, context, doctree):
+    """Add the rules used by the page to its ``<head>``,
+    and a ``<noscript>`` fallback for the asynchronously loaded stylesheets.
+    """
+    env = app.env
+    pathto = context["pathto"]
+    docnames = get_page_docnames(app, pagename, doctree)
+    css_files = get_page_css_files(app, docnames)
+    linked = [LOADER_NAME] if app.config.panels_css_loader else css_files
+    head = [
+        "<noscript>",
+        *(
+            f'<link rel="stylesheet" type="text/css" '
+            f'href="{pathto("_static/" + name, resource=True)}" />'
+            for name in linked
+        ),
+        "</noscript>",
+    ]
+    if any(docname in env.panels_usage for docname in docnames):
+        static_path = get_static_path(app)
+        paths = tuple(str(static_path / name) for name in css_files)
+        css = get_critical_css(paths, get_page_classes(app, docnames))
+        if css:
+            head.append(f"<style>{css}</style>")
+    context["metatags"] = context.get("metatags", "") + "\n".join(head) + "\n"
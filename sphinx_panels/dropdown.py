@@ -3,17 +3,12 @@
 from docutils import nodes
 from docutils.parsers.rst import directives
 from sphinx.util.docutils import SphinxDirective
-from sphinx.transforms.post_transforms import SphinxPostTransform
-from sphinx.util.nodes import NodeMatcher
 
-from .icons import get_opticon
-
-
-def setup_dropdown(app):
-    app.add_node(dropdown_main, html=(visit_dropdown_main, depart_dropdown_main))
-    app.add_node(dropdown_title, html=(visit_dropdown_title, depart_dropdown_title))
-    app.add_directive("dropdown", DropdownDirective)
-    app.add_post_transform(DropdownHtmlTransform)
+from .containers import div
+from .fragments import FRAGMENTS_URL, get_fragment_id, get_fragments
+from .icons import create_opticon_node, note_opticon
+from .usage import note_usage
+from .utils import intern_classes
 
 
 class dropdown_main(nodes.Element, nodes.General):
@@ -43,6 +38,35 @@ def depart_dropdown_title(self, node):
     self.body.append("</summary>")
 
 
+class dropdown_deferred(nodes.Element, nodes.General):
+    """The body of a closed dropdown, loaded when it is first opened."""
+
+
+def visit_dropdown_deferred(self, node):
+    fragments = get_fragments(self.document)
+    index = len(fragments)
+    fragments.append(None)
+    attributes = {
+        "data-fragment-url": FRAGMENTS_URL,
+        "data-fragment-id": get_fragment_id(index),
+    }
+    self.body.append(
+        self.starttag(node, "div", "", CLASS="panels-deferred", **attributes)
+    )
+    self.context.append((index, len(self.body)))
+
+
+def depart_dropdown_deferred(self, node):
+    index, start = self.context.pop()
+    # the body is moved to the fragments, and linked to for when JavaScript is off
+    get_fragments(self.document)[index] = "".join(self.body[start:])
+    del self.body[start:]
+    self.body.append(
+        f'<noscript><a href="{FRAGMENTS_URL}#{get_fragment_id(index)}">'
+        "Show content</a></noscript></div>\n"
+    )
+
+
 class DropdownDirective(SphinxDirective):
     optional_arguments = 1
     final_argument_whitespace = True
@@ -52,11 +76,15 @@ class DropdownDirective(SphinxDirective):
         "title": directives.unchanged,
         "body": directives.unchanged,
         "open": directives.flag,
+        "defer": directives.flag,
         "name": directives.unchanged,
         "animate": lambda a: directives.choice(a, ("fade-in", "fade-in-slide-down")),
     }
 
     def run(self):
+        note_usage(self.env, "dropdown")
+        if "defer" in self.options:
+            note_usage(self.env, "dropdown-defer")
 
         # default classes
         classes = {
@@ -85,9 +113,11 @@ class DropdownDirective(SphinxDirective):
         container = nodes.container(
             "",
             opened="open" in self.options,
+            defer="defer" in self.options,
             type="dropdown",
             has_title=len(self.arguments) > 0,
-            **classes
+            # shared by the dropdowns with the same classes
+            **{key: intern_classes(value) for key, value in classes.items()},
         )
         if self.arguments:
             textnodes, messages = self.state.inline_text(self.arguments[0], self.lineno)
@@ -95,6 +125,10 @@ class DropdownDirective(SphinxDirective):
             container += messages
         self.state.nested_parse(self.content, self.content_offset, container)
         self.add_name(container)
+        if not self.config.panels_dropdown_css_markers:
+            # the markers are added by PanelsHtmlTransform
+            note_opticon(self.env, "chevron-up", size=24)
+            note_opticon(self.env, "chevron-down", size=24)
         return [container]
 
 
@@ -109,72 +143,67 @@ KEBAB = """\
 </svg>"""
 
 
-class DropdownHtmlTransform(SphinxPostTransform):
-    default_priority = 200
-    formats = ("html",)
-
-    def run(self):
-        matcher = NodeMatcher(nodes.container, type="dropdown")
-        for node in self.document.traverse(matcher):
-
-            open_marker = nodes.container(
-                "",
-                nodes.raw(
-                    "", nodes.Text(get_opticon("chevron-up", size=24)), format="html"
-                ),
-                is_div=True,
-                classes=["summary-up"],
-            )
-            closed_marker = nodes.container(
-                "",
-                nodes.raw(
-                    "", nodes.Text(get_opticon("chevron-down", size=24)), format="html"
+def render_dropdown(
+    node: nodes.container, css_markers: bool, defer: bool = False
+) -> dropdown_main:
+    """Create the ``<details>`` node for a ``dropdown`` container,
+    moving its title and body into it.
+
+    :param defer: move the body to the page's fragment file, if it is closed
+    """
+    newnode = dropdown_main(
+        opened=node["opened"],
+        classes=["sphinx-bs", "dropdown", "card", *node["container_classes"]],
+    )
+    title_classes = ["summary-title", "card-header", *node["title_classes"]]
+
+    if node["has_title"]:
+        title_children = list(node[0])
+        body_children = node[1:]
+    elif css_markers:
+        title_children = []
+        title_classes.append("no-title")
+        body_children = node
+    else:
+        title_children = [
+            nodes.raw(
+                "...",
+                nodes.Text(
+                    KEBAB
+                    # Note the custom opticon here has thicker dots
+                    # get_opticon("kebab-horizontal", classes="no-title",
+                    # size=24)
                 ),
-                is_div=True,
-                classes=["summary-down"],
-            )
-
-            newnode = dropdown_main(
-                opened=node["opened"],
-                classes=["sphinx-bs", "dropdown", "card"] + node["container_classes"],
+                format="html",
             )
+        ]
+        body_children = node
 
-            if node["has_title"]:
-                title_children = node[0]
-                body_children = node[1:]
-            else:
-                title_children = [
-                    nodes.raw(
-                        "...",
-                        nodes.Text(
-                            KEBAB
-                            # Note the custom opticon here has thicker dots
-                            # get_opticon("kebab-horizontal", classes="no-title",
-                            # size=24)
-                        ),
-                        format="html",
-                    )
-                ]
-                body_children = node
-
-            newnode += dropdown_title(
-                "",
+    if css_markers:
+        # the markers are drawn by the `css-markers` CSS rules
+        newnode["classes"].append("css-markers")
+    else:
+        title_children += [
+            div(
                 "",
-                *title_children,
-                closed_marker,
-                open_marker,
-                classes=["summary-title", "card-header"] + node["title_classes"]
-            )
-            body_node = nodes.container(
+                create_opticon_node("chevron-down", size=24),
+                classes=["summary-down"],
+            ),
+            div(
                 "",
-                *body_children,
-                is_div=True,
-                classes=["summary-content", "card-body"] + node["body_classes"]
-            )
-            for para in body_node.traverse(nodes.paragraph):
-                para["classes"] = ([] if "classes" in para else para["classes"]) + [
-                    "card-text"
-                ]
-            newnode += body_node
-            # newnode += open_marker
-            node.replace_self(newnode)
+                create_opticon_node("chevron-up", size=24),
+                classes=["summary-up"],
+            ),
+        ]
+
+    newnode += dropdown_title("", "", *title_children, classes=title_classes)
+    if defer and not node["opened"]:
+        body_children = [dropdown_deferred("", *body_children)]
+    newnode += div(
+        "",
+        *body_children,
+        classes=["summary-content", "card-body", *node["body_classes"]],
+    )
+    # keep the ids and names of the container, as ``replace_self`` would
+    newnode.update_basic_atts(node)
+    return newnode
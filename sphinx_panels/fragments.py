@@ -0,0 +1,156 @@
+"""Write the deferred dropdown bodies of a page to a fragment file next to it.
+
+This is used when ``panels_defer_dropdowns = True``, or for dropdowns with ``:defer:``.
+The HTML visitor renders each deferred body into the document's fragments,
+leaving a placeholder in the page, that ``panels-dropdowns.js`` replaces with
+the body (fetched from the fragment file) when the dropdown is first opened.
+The fragment file is a plain HTML page, so it is also linked to,
+for when JavaScript is off.
+Likewise, the content of lazy tabs is copied to the fragment file,
+and linked to from the page, since its ``<template>`` is not shown without JavaScript.
+
+The fragment file of each page is recorded in ``<outdir>/.panels-fragments.json``,
+so that the previous file of a re-written page is removed by its exact name.
+Pages may be written in parallel workers, whose state is discarded when they exit,
+so they append their changes to a file per worker, merged when the build finishes.
+"""
+import hashlib
+import json
+import os
+from pathlib import Path
+import re
+from typing import List, Optional
+
+from docutils import nodes
+from sphinx.application import Sphinx
+from sphinx.util.logging import getLogger
+
+from .assets import write_atomic
+
+LOGGER = getLogger(__name__)
+
+# replaced by the name of the fragment file, once the page is rendered
+FRAGMENTS_URL = "__panels_fragments__"
+FRAGMENTS_SUFFIX = ".panels.html"
+# the fragment file of each page, in the output directory
+RECORD_NAME = ".panels-fragments.json"
+# the changes to the record by parallel write workers, in the doctree directory
+WORKERS_DIR = "panels-fragments"
+FRAGMENTS_TEMPLATE = """\
+<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+</head>
+<body>
+{bodies}
+</body>
+</html>
+"""
+
+
+def setup_fragments(app: Sphinx):
+    read_fragments_record(app)
+    app.connect("html-page-context", write_fragments)
+    app.connect("build-finished", write_fragments_record)
+
+
+def get_fragments(document: nodes.document) -> List[Optional[str]]:
+    """Return the rendered bodies of the document, in order."""
+    if not hasattr(document, "panels_fragments"):
+        document.panels_fragments = []
+    return document.panels_fragments
+
+
+def get_fragment_id(index: int) -> str:
+    return f"panels-fragment-{index}"
+
+
+def get_fragments_name(stem: str, content: str) -> str:
+    digest = hashlib.md5(content.encode("utf8")).hexdigest()
+    return f"{stem}.{digest}{FRAGMENTS_SUFFIX}"
+
+
+def read_fragments_record(app: Sphinx):
+    """Read the fragment file of each page, written by the previous build."""
+    try:
+        record = json.loads((Path(app.outdir) / RECORD_NAME).read_text(encoding="utf8"))
+    except (OSError, ValueError):
+        record = {}
+    app.builder.panels_fragments = record
+    app.builder.panels_fragments_changes = {}
+    app.builder.panels_fragments_pid = os.getpid()
+
+
+def note_fragments(app: Sphinx, pagename: str, name: Optional[str]):
+    """Record the fragment file of the page (``None`` if it has none)."""
+    if os.getpid() == app.builder.panels_fragments_pid:
+        app.builder.panels_fragments_changes[pagename] = name
+        return
+    path = Path(app.doctreedir) / WORKERS_DIR / f"{os.getpid()}.jsonl"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a", encoding="utf8") as handle:
+        handle.write(json.dumps([pagename, name]) + "\n")
+
+
+def write_fragments(app: Sphinx, pagename, templatename, context, doctree):
+    """Write the fragment file of the page, if it has any deferred bodies,
+    and remove the previous fragment file of the page.
+    """
+    if "body" not in context or not hasattr(app.builder, "panels_fragments"):
+        return
+    path = Path(app.builder.get_outfilename(pagename))
+    old_name = app.builder.panels_fragments.get(pagename)
+    name = None
+    fragments = getattr(doctree, "panels_fragments", None)
+    if fragments:
+        bodies = "\n".join(
+            f'<div id="{get_fragment_id(index)}">\n{body}</div>'
+            for index, body in enumerate(fragments)
+        )
+        # the title is already rendered to HTML
+        title = re.sub(r"<[^>]*>", "", context.get("title", ""))
+        content = FRAGMENTS_TEMPLATE.format(title=title, bodies=bodies)
+        name = get_fragments_name(path.stem, content)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(
+            path.parent / name, content.replace(FRAGMENTS_URL, name).encode("utf8")
+        )
+        context["body"] = context["body"].replace(FRAGMENTS_URL, name)
+    old_path = path.parent / old_name if old_name else None
+    if old_name != name and old_path and old_path.exists():
+        LOGGER.debug(f"removing old sphinx-panels fragments: {old_path}")
+        old_path.unlink()
+    if name != old_name:
+        note_fragments(app, pagename, name)
+
+
+def write_fragments_record(app: Sphinx, exception):
+    """Merge the changes of the build (and its workers) into the record."""
+    if not hasattr(app.builder, "panels_fragments"):
+        return
+    changes = dict(app.builder.panels_fragments_changes)
+    workers_path = Path(app.doctreedir) / WORKERS_DIR
+    if workers_path.is_dir():
+        for path in sorted(workers_path.glob("*.jsonl")):
+            for line in path.read_text(encoding="utf8").splitlines():
+                pagename, name = json.loads(line)
+                changes[pagename] = name
+            path.unlink()
+        workers_path.rmdir()
+    if not changes:
+        return
+    record = app.builder.panels_fragments
+    for pagename, name in changes.items():
+        if name is None:
+            record.pop(pagename, None)
+        else:
+            record[pagename] = name
+    record_path = Path(app.outdir) / RECORD_NAME
+    if record:
+        content = json.dumps(record, indent=1, sort_keys=True).encode("utf8")
+        write_atomic(record_path, content)
+    elif record_path.exists():
+        record_path.unlink()
+    app.builder.panels_fragments_changes = {}
@@ -1,9 +1,16 @@
 from functools import lru_cache
+import hashlib
 import json
+import mmap
 from pathlib import Path
 
 from docutils import nodes
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.util.osutil import relative_uri
 
+from .assets import sync_static_assets
+from .usage import note_usage
 from .utils import string_to_func_inputs
 
 
@@ -17,17 +24,80 @@ OPTICON_CSS = """\
 }"""
 
 
+DATA_PATH = Path(__file__).parent.joinpath("data", "opticons.json")
+INDEX_PATH = Path(__file__).parent.joinpath("data", "opticons.index")
+
+
 @lru_cache(1)
 def get_opticon_data():
-    path = Path(__file__).parent.joinpath("data", "opticons.json")
-    return json.loads(path.read_text())
+    return json.loads(DATA_PATH.read_text())
+
+
+def compile_opticon_index(data: dict) -> bytes:
+    """Compile the opticon data to an index, of only the path/width per (name, size).
+
+    The index is a single line JSON header, mapping ``name/size`` to
+    ``[offset, length, width]``, followed by the concatenated UTF-8 paths.
+    """
+    header = {}
+    paths = []
+    offset = 0
+    for name, icon in sorted(data.items()):
+        for size, size_data in sorted(icon["heights"].items(), key=lambda i: int(i[0])):
+            path = size_data["path"].encode("utf8")
+            header[f"{name}/{size}"] = [offset, len(path), size_data["width"]]
+            paths.append(path)
+            offset += len(path)
+    return (
+        json.dumps(header, separators=(",", ":")).encode("utf8")
+        + b"\n"
+        + b"".join(paths)
+    )
+
+
+class OpticonIndex:
+    """Read opticons lazily from the (memory-mapped) compiled index."""
+
+    def __init__(self, path: Path):
+        with open(path, "rb") as handle:
+            self._map = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+        header_end = self._map.find(b"\n")
+        self._header = json.loads(self._map[:header_end])
+        self._start = header_end + 1
+        self._cache = {}
+
+    def names(self):
+        return list(dict.fromkeys(key.rsplit("/", 1)[0] for key in self._header))
+
+    def get(self, name: str, size: int) -> dict:
+        key = f"{name}/{size}"
+        if key not in self._cache:
+            offset, length, width = self._header[key]
+            start = self._start + offset
+            path = self._map[start : start + length].decode("utf8")
+            self._cache[key] = {"path": path, "width": width}
+        return self._cache[key]
+
+
+@lru_cache(1)
+def get_opticon_index() -> OpticonIndex:
+    return OpticonIndex(INDEX_PATH)
 
 
 def list_opticons():
-    return list(get_opticon_data().keys())
+    return get_opticon_index().names()
 
 
-def get_opticon(
+def get_opticon_size_data(name: str, size: int) -> dict:
+    """Return the ``path`` and ``width`` of an opticon, at a given size."""
+    assert size in [16, 24], "size must be 16 or 24"
+    try:
+        return get_opticon_index().get(name, int(size))
+    except KeyError:
+        raise KeyError(f"Unrecognised opticon: {name}")
+
+
+def get_opticon_options(
     name: str,
     classes: str = None,
     width: int = None,
@@ -35,16 +105,11 @@ def get_opticon(
     aria_label: str = None,
     size: int = 16,
 ):
-    assert size in [16, 24], "size must be 16 or 24"
-    try:
-        data = get_opticon_data()[name]
-    except KeyError:
-        raise KeyError(f"Unrecognised opticon: {name}")
-
-    content = data["heights"][str(size)]["path"]
+    """Return the attributes of the ``<svg>`` element for an opticon."""
+    data = get_opticon_size_data(name, size)
     options = {
         "version": "1.1",
-        "width": data["heights"][str(size)]["width"],
+        "width": data["width"],
         "height": int(size),
         "class": f"octicon octicon-{name}",
     }
@@ -68,24 +133,175 @@ def get_opticon(
     else:
         options["aria-hidden"] = "true"
 
-    opt_string = " ".join(f'{k}="{v}"' for k, v in options.items())
-    return f"<svg {opt_string}>{content}</svg>"
+    return options
+
+
+def format_svg_options(options: dict) -> str:
+    return " ".join(f'{k}="{v}"' for k, v in options.items())
+
+
+def get_opticon(
+    name: str,
+    classes: str = None,
+    width: int = None,
+    height: int = None,
+    aria_label: str = None,
+    size: int = 16,
+):
+    options = get_opticon_options(name, classes, width, height, aria_label, size)
+    content = get_opticon_size_data(name, size)["path"]
+    return f"<svg {format_svg_options(options)}>{content}</svg>"
+
+
+class opticon(nodes.Element, nodes.General):
+    """An opticon, rendered as inline SVG or a reference to the sprite sheet.
+
+    Only the inputs of the icon are stored, rather than its SVG,
+    which is created when the page is written.
+    """
+
+
+def get_opticon_symbol_id(name: str, size: int) -> str:
+    return f"octicon-{name}-{size}"
+
+
+def create_opticon_node(
+    name: str,
+    classes: str = None,
+    width: int = None,
+    height: int = None,
+    aria_label: str = None,
+    size: int = 16,
+) -> nodes.Element:
+    """Create the node for an opticon,
+    which is either inline SVG or, in sprite mode, a reference to the sprite sheet.
+    """
+    # check the inputs now, so that errors are reported when the document is read
+    get_opticon_options(name, classes, width, height, aria_label, size)
+    inputs = {
+        "icon_classes": classes,
+        "width": width,
+        "height": height,
+        "aria_label": aria_label,
+    }
+    return opticon(
+        icon_name=name,
+        size=int(size),
+        **{key: value for key, value in inputs.items() if value is not None},
+    )
+
+
+def get_opticon_node_options(node: opticon) -> dict:
+    return get_opticon_options(
+        node["icon_name"],
+        node.get("icon_classes"),
+        node.get("width"),
+        node.get("height"),
+        node.get("aria_label"),
+        node["size"],
+    )
+
+
+def note_opticon(env: BuildEnvironment, name: str, size: int = 16):
+    """Record that the current document uses an opticon, for the sprite sheet."""
+    if env.config.panels_opticon_sprite:
+        env.panels_opticons.setdefault(env.docname, set()).add((name, size))
 
 
 def opticon_role(
     role, rawtext: str, text: str, lineno, inliner, options={}, content=[]
 ):
+    env = inliner.document.settings.env
+    note_usage(env, "opticon")
     try:
         args, kwargs = string_to_func_inputs(text)
-        svg = get_opticon(*args, **kwargs)
+        node = create_opticon_node(*args, **kwargs)
     except Exception as err:
         msg = inliner.reporter.error(f"Opticon input is invalid: {err}", line=lineno)
         prb = inliner.problematic(rawtext, rawtext, msg)
         return [prb], [msg]
-    node = nodes.raw("", nodes.Text(svg), format="html")
+    note_opticon(env, node["icon_name"], node["size"])
     return [node], []
 
 
+def visit_opticon_html(self, node):
+    if not self.config.panels_opticon_sprite:
+        content = get_opticon_size_data(node["icon_name"], node["size"])["path"]
+        options = format_svg_options(get_opticon_node_options(node))
+        self.body.append(f"<svg {options}>{content}</svg>")
+        raise nodes.SkipNode
+    sprite_uri = relative_uri(
+        self.builder.get_target_uri(self.builder.current_docname),
+        f"_static/{self.builder.env.panels_opticon_sprite}",
+    )
+    symbol_id = get_opticon_symbol_id(node["icon_name"], node["size"])
+    self.body.append(
+        f"<svg {format_svg_options(get_opticon_node_options(node))}>"
+        f'<use href="{sprite_uri}#{symbol_id}"></use></svg>'
+    )
+    raise nodes.SkipNode
+
+
+def skip_node(self, node):
+    raise nodes.SkipNode
+
+
+def create_opticon_sprite(icons) -> str:
+    """Create an SVG sprite sheet, with a ``<symbol>`` per (name, size)."""
+    lines = ['<svg xmlns="http://www.w3.org/2000/svg" style="display: none;">']
+    for name, size in sorted(icons):
+        data = get_opticon_size_data(name, size)
+        lines.append(
+            f'<symbol id="{get_opticon_symbol_id(name, size)}" '
+            f'viewBox="0 0 {data["width"]} {size}">{data["path"]}</symbol>'
+        )
+    lines.append("</svg>")
+    return "\n".join(lines)
+
+
+def load_opticon_index(app: Sphinx):
+    """Load the index in the main process,
+    so that it is shared by any (forked) parallel workers.
+    """
+    get_opticon_index()
+
+
+def init_opticon_sprite(app: Sphinx):
+    if not hasattr(app.env, "panels_opticons"):
+        app.env.panels_opticons = {}
+        app.env.panels_opticon_sprite = None
+
+
+def purge_opticons(app: Sphinx, env: BuildEnvironment, docname: str):
+    env.panels_opticons.pop(docname, None)
+
+
+def merge_opticons(app: Sphinx, env: BuildEnvironment, docnames, other):
+    for docname in docnames:
+        if docname in other.panels_opticons:
+            env.panels_opticons[docname] = other.panels_opticons[docname]
+
+
+def write_opticon_sprite(app: Sphinx, env: BuildEnvironment):
+    """Write the sprite sheet of all opticons used in the project.
+
+    If its content (and so hashed name) has changed,
+    the documents referencing it must be re-written.
+    """
+    if not app.config.panels_opticon_sprite:
+        sync_static_assets(app, "opticons", {})
+        return
+    icons = set().union(*env.panels_opticons.values())
+    content = create_opticon_sprite(icons)
+    digest = hashlib.md5(content.encode("utf8")).hexdigest()
+    filename = f"panels-opticons.{digest}.svg"
+    sync_static_assets(app, "opticons", {filename: lambda: content})
+
+    if filename != env.panels_opticon_sprite:
+        env.panels_opticon_sprite = filename
+        return list(env.panels_opticons)
+
+
 class fontawesome(nodes.Element, nodes.General):
     pass
 
@@ -99,6 +315,7 @@ def create_fa_node(name, classes: str = None, style="fa"):
 
 
 def fontawesome_role(role, rawtext, text, lineno, inliner, options={}, content=[]):
+    note_usage(inliner.document.settings.env, "fa")
     try:
         args, kwargs = string_to_func_inputs(text)
         node = create_fa_node(*args, **kwargs)
@@ -131,11 +348,22 @@ def add_fontawesome_pkg(app, config):
 
 
 def setup_icons(app):
-    app.add_role("opticon", opticon_role)
-    app.add_role("fa", fontawesome_role)
-
-    app.add_config_value("panels_add_fontawesome_latex", False, "env")
+    app.add_config_value("panels_add_fontawesome_latex", False, "")
+    app.add_config_value("panels_opticon_sprite", False, "")
     app.connect("config-inited", add_fontawesome_pkg)
+    app.connect("builder-inited", load_opticon_index)
+    app.connect("builder-inited", init_opticon_sprite)
+    app.connect("env-purge-doc", purge_opticons)
+    app.connect("env-merge-info", merge_opticons)
+    app.connect("env-updated", write_opticon_sprite)
+    app.add_node(
+        opticon,
+        html=(visit_opticon_html, None),
+        latex=(skip_node, None),
+        text=(skip_node, None),
+        man=(skip_node, None),
+        texinfo=(skip_node, None),
+    )
     app.add_node(
         fontawesome,
         html=(visit_fontawesome_html, depart_fontawesome_html),
@@ -0,0 +1,253 @@
+"""Performance attributes for the card images (``img-top`` / ``img-bottom``).
+
+The intrinsic size of the (local) card images is probed once all documents are read,
+in a thread pool, and cached in the environment by file modification time and size.
+In HTML, the images then get ``width`` and ``height`` attributes (so the page does
+not shift when they load), ``loading="lazy"`` and ``decoding="async"``,
+apart from the first ``panels_img_priority`` images of each page,
+which get ``fetchpriority="high"``.
+
+With ``panels_img_srcset``, downscaled variants are written (using Pillow),
+and added to the images' ``srcset``. The variants are named by the hash of their
+source file, and cached in ``<doctreedir>/panels-images``.
+
+The images are only collected by HTML builds, so a document re-read by another
+builder loses its ``card-images`` usage, and is re-read by the next HTML build.
+"""
+import hashlib
+from pathlib import Path
+import posixpath
+from typing import List, Optional
+
+from docutils import nodes
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.util.logging import getLogger
+from sphinx.util.osutil import relative_uri
+
+from .assets import sync_static_assets
+from .usage import get_docs_using, note_usage
+
+LOGGER = getLogger(__name__)
+
+CACHE_DIR = "panels-images"
+# the formats that downscaled variants are written for
+VARIANT_SUFFIXES = (".png", ".jpg", ".jpeg", ".webp")
+# the usage of the documents whose card images are collected
+COLLECTED = "card-images"
+
+
+class card_image(nodes.image):
+    """An ``img-top`` / ``img-bottom`` image of a card.
+
+    Other builders fall back to their ``image`` visitors.
+    """
+
+
+def setup_images(app: Sphinx):
+    init_card_images(app)
+    app.connect("env-get-outdated", get_uncollected_docs)
+    # after the image URIs are resolved, by sphinx's ImageCollector
+    app.connect("doctree-read", collect_card_images, priority=600)
+    app.connect("env-purge-doc", purge_card_images)
+    app.connect("env-merge-info", merge_card_images)
+    app.connect("env-updated", probe_card_images)
+    app.add_node(card_image, html=(visit_card_image_html, None))
+
+
+def init_card_images(app: Sphinx):
+    if not hasattr(app.env, "panels_card_images"):
+        app.env.panels_card_images = {}
+        app.env.panels_image_records = {}
+    # documents removed by another builder
+    for docname in list(app.env.panels_card_images):
+        if docname not in app.env.all_docs:
+            del app.env.panels_card_images[docname]
+
+
+def get_uncollected_docs(
+    app: Sphinx, env: BuildEnvironment, added, changed, removed
+) -> List[str]:
+    """Return the documents whose card images were not collected,
+    since they were last read by another builder.
+    """
+    docnames = get_docs_using(env, ["panels"]) - get_docs_using(env, [COLLECTED])
+    return sorted(docnames - set(removed))
+
+
+def collect_card_images(app: Sphinx, doctree: nodes.document):
+    """Record the local card images used in the document."""
+    env = app.env
+    if "panels" not in env.panels_usage.get(env.docname, ()):
+        return
+    note_usage(env, COLLECTED)
+    uris = {
+        node["uri"]
+        for node in doctree.traverse(card_image)
+        if "://" not in node["uri"] and not node["uri"].startswith("data:")
+    }
+    if uris:
+        env.panels_card_images[env.docname] = uris
+
+
+def purge_card_images(app: Sphinx, env: BuildEnvironment, docname: str):
+    env.panels_card_images.pop(docname, None)
+
+
+def merge_card_images(app: Sphinx, env: BuildEnvironment, docnames, other):
+    for docname in docnames:
+        if docname in other.panels_card_images:
+            env.panels_card_images[docname] = other.panels_card_images[docname]
+
+
+def probe_image(path: Path, signature: List[int], digest: bool) -> dict:
+    """Return the record of an image: its size and (optionally) content hash."""
+    from sphinx.util.images import get_image_size
+
+    size = get_image_size(str(path))
+    return {
+        "signature": signature,
+        "width": size[0] if size else None,
+        "height": size[1] if size else None,
+        "md5": hashlib.md5(path.read_bytes()).hexdigest() if digest else None,
+        "variants": [],
+    }
+
+
+def get_variant_name(uri: str, md5: str, width: int) -> str:
+    stem, suffix = posixpath.splitext(posixpath.basename(uri))
+    return f"{stem}.{md5}.{width}w{suffix.lower()}"
+
+
+def write_variant(source: Path, target: Path, width: int):
+    """Write a copy of the image, downscaled to ``width``."""
+    from PIL import Image
+
+    with Image.open(source) as image:
+        height = round(image.height * width / image.width)
+        variant = image.resize((width, height), Image.LANCZOS)
+        temp_path = target.with_name(".tmp-" + target.name)
+        variant.save(temp_path, format=image.format)
+    temp_path.replace(target)
+
+
+def probe_card_images(app: Sphinx, env: BuildEnvironment):
+    """Probe the size of the card images (that have changed) in a thread pool,
+    and write their downscaled variants, for ``panels_img_srcset``.
+    """
+    if app.builder.format != "html":
+        return
+    from concurrent.futures import ThreadPoolExecutor
+
+    # the widths may be strings, when set with ``-D``
+    widths = sorted({int(width) for width in app.config.panels_img_srcset})
+    if widths:
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            LOGGER.warning("`panels_img_srcset` requires Pillow: pip install pillow")
+            widths = []
+
+    uris = set().union(*env.panels_card_images.values())
+    records = env.panels_image_records
+    for uri in set(records).difference(uris):
+        records.pop(uri)
+    pending = {}
+    for uri in sorted(uris):
+        path = Path(app.srcdir) / uri
+        try:
+            stat = path.stat()
+        except OSError:
+            records.pop(uri, None)
+            continue
+        signature = [stat.st_mtime_ns, stat.st_size]
+        record = records.get(uri)
+        if (
+            record is None
+            or record["signature"] != signature
+            or (widths and record["md5"] is None)
+        ):
+            pending[uri] = (path, signature)
+
+    cache_path = Path(app.doctreedir) / CACHE_DIR
+    assets = {}
+    with ThreadPoolExecutor() as executor:
+        for uri, record in zip(
+            pending,
+            executor.map(
+                lambda item: probe_image(*item, digest=bool(widths)), pending.values()
+            ),
+        ):
+            records[uri] = record
+
+        # the variants to write, for images that are wider than the variant
+        variants = []
+        for uri in sorted(uris.intersection(records)):
+            record = records[uri]
+            record["variants"] = []
+            if not widths or not uri.lower().endswith(VARIANT_SUFFIXES):
+                continue
+            for width in widths:
+                if record["width"] is None or width >= record["width"]:
+                    continue
+                name = get_variant_name(uri, record["md5"], width)
+                record["variants"].append([width, name])
+                assets[name] = (cache_path / name).read_bytes
+                if not (cache_path / name).exists():
+                    variants.append((Path(app.srcdir) / uri, cache_path / name, width))
+        if variants:
+            cache_path.mkdir(parents=True, exist_ok=True)
+            LOGGER.info(f"sphinx-panels: writing {len(variants)} image variants")
+            for future in [executor.submit(write_variant, *v) for v in variants]:
+                future.result()
+
+    sync_static_assets(app, "images", assets)
+
+
+def get_card_image_attributes(self, node: card_image) -> dict:
+    """Return the attributes to add to the ``<img>`` of a card image."""
+    config = self.builder.config
+    attributes = {}
+    record: Optional[dict] = self.builder.env.panels_image_records.get(node["uri"])
+    if record and record["width"] and "width" not in node and "height" not in node:
+        attributes["width"] = str(record["width"])
+        attributes["height"] = str(record["height"])
+
+    # the index of the card image in the page
+    index = getattr(self, "panels_card_images", 0)
+    self.panels_card_images = index + 1
+    if index < config.panels_img_priority:
+        attributes["fetchpriority"] = "high"
+    elif config.panels_img_lazy:
+        attributes["loading"] = "lazy"
+        attributes["decoding"] = "async"
+
+    if record and record["variants"] and "width" in attributes:
+        # the image itself is added last, by `visit_card_image_html`
+        page_uri = self.builder.get_target_uri(self.builder.current_docname)
+        attributes["srcset"] = [
+            f"{relative_uri(page_uri, '_static/' + name)} {width}w"
+            for width, name in record["variants"]
+        ]
+        attributes["sizes"] = config.panels_img_srcset_sizes
+    return attributes
+
+
+def visit_card_image_html(self, node: card_image):
+    """Visit the image, adding the attributes to its ``<img>`` tag."""
+    attributes = get_card_image_attributes(self, node)
+    emptytag = self.emptytag
+
+    def _emptytag(node, tagname, suffix="\n", **atts):
+        if tagname == "img":
+            atts.update(attributes)
+            if "srcset" in attributes:
+                srcset = attributes["srcset"] + [f"{atts['src']} {atts['width']}w"]
+                atts["srcset"] = ", ".join(srcset)
+        return emptytag(node, tagname, suffix, **atts)
+
+    self.emptytag = _emptytag
+    try:
+        self.visit_image(node)
+    finally:
+        del self.emptytag
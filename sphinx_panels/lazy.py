@@ -0,0 +1,81 @@
+"""Register the sphinx-panels components, without importing their modules.
+
+The directives and roles are registered as ``module:name`` paths,
+relative to this package, and the module is only imported when the object
+is first used, e.g. when a document contains the directive.
+So a build (or parallel worker) that never uses a component never imports it.
+Likewise, the features that only HTML builders need, or that are turned on
+by a config value, are only imported when the builder is initialised.
+"""
+from functools import lru_cache
+from importlib import import_module
+
+# the directives and roles, imported when first used
+DIRECTIVES = {
+    "panels": "panels:Panels",
+    "link-button": "button:LinkButton",
+    "dropdown": "dropdown:DropdownDirective",
+    "tabbed": "tabs:TabbedDirective",
+}
+ROLES = {
+    # TODO hide badges in non-HTML?
+    "badge": "button:badge_role",
+    "link-badge": "button:link_badge_role",
+    "opticon": "icons:opticon_role",
+    "fa": "icons:fontawesome_role",
+}
+# the HTML nodes and post-transform, registered if any of the components is used
+HTML_SETUP = {
+    "dropdown": "transforms:setup_panels_html",
+    "panels": "transforms:setup_panels_html",
+    "tabbed": "transforms:setup_panels_html",
+}
+# the reference resolver, registered (for any builder) if any of the components is used
+USAGE_SETUP = {
+    "link-badge": "links:setup_links",
+    "link-button": "links:setup_links",
+}
+# the features set up when the builder is initialised,
+# if their config value is on (or always, for None) and whether only for HTML builders
+BUILDER_SETUP = {
+    "bundles:setup_bundles": ("panels_css_bundles", True),
+    "critical:setup_critical_css": ("panels_css_critical", True),
+    "fragments:setup_fragments": (None, True),
+    "images:setup_images": (None, True),
+    "profile:setup_profile": ("panels_profile", False),
+}
+
+
+@lru_cache(maxsize=None)
+def import_object(path: str):
+    module_name, name = path.split(":")
+    return getattr(import_module(f"{__package__}.{module_name}"), name)
+
+
+class LazyClass(type):
+    """The type of a stand-in for a class, which imports the class on first use.
+
+    Class attribute lookups (e.g. a directive's ``option_spec``)
+    and instantiation are forwarded to the imported class.
+    """
+
+    def __getattr__(cls, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(import_object(cls.lazy_path), name)
+
+    def __call__(cls, *args, **kwargs):
+        return import_object(cls.lazy_path)(*args, **kwargs)
+
+
+def lazy_class(path: str) -> type:
+    return LazyClass(path.split(":")[1], (), {"lazy_path": path})
+
+
+def lazy_function(path: str):
+    def _function(*args, **kwargs):
+        return import_object(path)(*args, **kwargs)
+
+    _function.__name__ = path.split(":")[1]
+    _function.lazy_path = path
+    return _function
@@ -0,0 +1,95 @@
+"""Resolve the references of ``link-button`` and ``link-badge``, with a given role.
+
+References with a role (e.g. ``ref``, ``doc`` or ``py:class``) are resolved
+directly in its domain, rather than querying every domain (as for ``any``).
+The targets of each domain and role are indexed once per build,
+so that repeated links to the same target are cheap to resolve.
+References that are not found in the index are left to sphinx's resolver,
+so that they are resolved (or reported as missing) in the usual way.
+"""
+from typing import Dict, Tuple
+
+from sphinx import addnodes
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.transforms.post_transforms import SphinxPostTransform
+from sphinx.util.nodes import make_refnode
+from sphinx.util import docname_join
+
+
+class link_xref(addnodes.pending_xref):
+    """A reference of a ``link-button`` or ``link-badge``."""
+
+
+def setup_links(app: Sphinx):
+    app.add_post_transform(LinkTargetResolver)
+    reset_link_targets(app, app.env)
+
+
+def get_xref_role(env: BuildEnvironment, role: str) -> Tuple[str, str, bool]:
+    """Return the domain and type of a cross-reference role, e.g. ``py:class``,
+    and whether its targets are lowercased.
+
+    Roles without a domain are looked up in the default domain, then ``std``.
+    """
+    if ":" in role:
+        domain_names = [role.split(":", 1)[0]]
+        name = role.split(":", 1)[1]
+    else:
+        default_domain = env.temp_data.get("default_domain")
+        domain_names = [default_domain.name] if default_domain else []
+        domain_names.append("std")
+        name = role
+    for domain_name in domain_names:
+        domain = env.domains.get(domain_name)
+        if domain is not None and name in domain.roles:
+            lowercase = getattr(domain.roles[name], "lowercase", False)
+            return domain_name, name, lowercase
+    raise ValueError(f"unknown reference role: {role!r}")
+
+
+def reset_link_targets(app: Sphinx, env: BuildEnvironment):
+    app.builder.panels_link_targets = {}
+
+
+def get_link_targets(
+    app: Sphinx, domain_name: str, reftype: str
+) -> Dict[str, Tuple[str, str]]:
+    """Return the targets of a domain's role: name -> (docname, anchor)."""
+    if not hasattr(app.builder, "panels_link_targets"):
+        app.builder.panels_link_targets = {}
+    memo = app.builder.panels_link_targets
+    key = (domain_name, reftype)
+    if key not in memo:
+        domain = app.env.get_domain(domain_name)
+        objtypes = set(domain.objtypes_for_role(reftype) or ())
+        targets = {}
+        for name, _, objtype, docname, anchor, _ in domain.get_objects():
+            if objtype in objtypes:
+                targets.setdefault(name, (docname, anchor))
+        memo[key] = targets
+    return memo[key]
+
+
+class LinkTargetResolver(SphinxPostTransform):
+    """Resolve the references with a role, that are found in the role's targets."""
+
+    # before sphinx's ReferencesResolver
+    default_priority = 5
+
+    def run(self):
+        for node in self.document.traverse(link_xref):
+            domain_name, reftype = node["refdomain"], node["reftype"]
+            if not domain_name:
+                continue
+            refdoc = node.get("refdoc", self.env.docname)
+            target = node["reftarget"]
+            if (domain_name, reftype) == ("std", "doc"):
+                # documents can be referenced relative to the current document
+                target = docname_join(refdoc, target)
+            found = get_link_targets(self.app, domain_name, reftype).get(target)
+            if found is None:
+                continue
+            docname, anchor = found
+            newnode = make_refnode(self.app.builder, refdoc, docname, anchor, node[0])
+            node.replace_self(newnode)
@@ -1,12 +1,30 @@
+from functools import lru_cache
 import re
+from typing import Callable, Dict, List, Optional, Tuple
 
 from docutils import nodes
 from docutils.parsers.rst import directives
 from sphinx.util.docutils import SphinxDirective
 
+from .card_data import CLASS_KEYS, IMAGE_KEYS, load_cards
+from .containers import card_region, div, panel_card
+from .images import card_image
+from .usage import note_usage
+from .utils import intern_classes
+
 DEFAULT_CONTAINER = "container pb-4"
 DEFAULT_COLUMN = "col-lg-6 col-md-6 col-sm-6 col-xs-12 p-2"
 DEFAULT_CARD = "shadow"
+DEFAULT_DELIMITERS = (r"^\-{3,}$", r"^\^{3,}$", r"^\+{3,}$")
+DELIMITER_NAMES = ("panel", "header", "footer")
+
+# a line that is always parsed to a paragraph (of inline text),
+# i.e. that does not start an enumerated list, or any other block
+RE_INLINE_LINE = re.compile(
+    r"^(?!([0-9]+|[a-zA-Z]|[ivxlcdm]+|[IVXLCDM]+)[.)](\s|$))[^\W_](?!.*::$)"
+)
+
+RE_BLANK_LINES = re.compile(r"\n\s*\n")
 
 RE_OPTIONS = re.compile(
     r"\:(column|card|body|header|footer|"
@@ -14,137 +32,227 @@ RE_OPTIONS = re.compile(
 )
 
 
-def setup_panels(app):
-    app.add_directive("panels", Panels)
-    app.add_config_value(
-        "panels_delimiters", (r"^\-{3,}$", r"^\^{3,}$", r"^\+{3,}$"), "env"
+@lru_cache(maxsize=8)
+def get_delimiter_matcher(
+    panel: str, header: str, footer: str
+) -> Callable[[str], Optional[str]]:
+    """Return a function, that returns the name of the delimiter a line matches.
+
+    Delimiters without groups or inline flags are combined into a single regex.
+    Otherwise they are matched in turn, since combining them would renumber
+    their groups (e.g. for a backreference like ``^(=)\\1{2,}$``),
+    duplicate their named groups, or move their flags from the start of the regex.
+    """
+    regexes = [re.compile(pattern) for pattern in (panel, header, footer)]
+    if any(regex.groups or regex.flags != re.UNICODE for regex in regexes):
+
+        def _match(line: str) -> Optional[str]:
+            for name, regex in zip(DELIMITER_NAMES, regexes):
+                if regex.match(line):
+                    return name
+            return None
+
+        return _match
+
+    combined = re.compile(
+        "|".join(
+            f"(?P<{name}>{regex.pattern})"
+            for name, regex in zip(DELIMITER_NAMES, regexes)
+        )
     )
-    app.connect("config-inited", validate_config)
 
+    def _match_combined(line: str) -> Optional[str]:
+        match = combined.match(line)
+        return match.lastgroup if match else None
 
-def parse_panels(
+    return _match_combined
+
+
+class PanelBlock:
+    """The regions of a single panel, as ``(start, end)`` line indices of the content.
+
+    The lines are only sliced from the content when a region is requested,
+    and only the classes set by the panel's own options are stored.
+    """
+
+    __slots__ = ("header", "body", "footer", "defaults", "overrides", "images")
+
+    def __init__(self, defaults: Dict[str, List[str]]):
+        self.header: Optional[Tuple[int, int]] = None
+        self.body: Tuple[int, int] = (0, 0)
+        self.footer: Optional[Tuple[int, int]] = None
+        self.defaults = defaults
+        self.overrides: Dict[str, List[str]] = {}
+        self.images: Dict[str, str] = {}
+
+    def get_classes(self, key: str) -> List[str]:
+        return self.overrides.get(key, self.defaults.get(key, []))
+
+    def get_offset(self, name: str, content_offset: int = 0) -> int:
+        """Return the input offset of the header, body or footer."""
+        if name == "footer":
+            # the footer offset is that of its delimiter line
+            return content_offset + self.footer[0] - 1
+        return content_offset + getattr(self, name)[0]
+
+    def get_region(self, content, name: str, content_offset: int = 0):
+        """Return the ``(lines, offset)`` of the header, body or footer."""
+        start, end = getattr(self, name)
+        return content[start:end], self.get_offset(name, content_offset)
+
+    def as_dict(self, content, content_offset: int = 0) -> dict:
+        output = dict(self.images)
+        classes = {**self.defaults, **self.overrides}
+        if classes:
+            output["classes"] = classes
+        for name in ("header", "body", "footer"):
+            if getattr(self, name) is not None:
+                output[name] = self.get_region(content, name, content_offset)
+        return output
+
+
+class DataPanel(PanelBlock):
+    """A single panel, from a card of a data file (see ``card_data``).
+
+    The regions are the text of the card, rather than line indices of the content.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, card: Dict[str, str], defaults: Dict[str, List[str]]):
+        super().__init__(defaults)
+        self.header = card.get("header")
+        self.body = card.get("body", "")
+        self.footer = card.get("footer")
+        self.images = {key: card[key] for key in IMAGE_KEYS if key in card}
+        for data_key, key in CLASS_KEYS.items():
+            if data_key not in card:
+                continue
+            value = card[data_key].strip()
+            if value.startswith("+"):
+                self.overrides[key] = self.get_classes(key) + value[1:].split()
+            else:
+                self.overrides[key] = value.split()
+
+
+def scan_panels(
     content,
-    content_offset,
-    default_classes,
-    panel_regex=None,
-    head_regex=None,
-    foot_regex=None,
-):
-    """split a block of content into panels.
+    default_classes: Dict[str, List[str]],
+    match_delimiter: Callable[[str], Optional[str]] = None,
+) -> List[PanelBlock]:
+    """Split a block of content into panels, in a single pass over its lines.
 
     example::
 
         ---
         header
-        ===
+        ^^^
         body
-        ...
+        +++
         footer
         ---
         next panel
 
+    :param match_delimiter: returns ``panel``, ``header``, ``footer`` or None
+        for a line, as returned by ``get_delimiter_matcher``
     """
-    panel_regex = panel_regex or re.compile(r"^\-{3,}$")
-    head_regex = head_regex or re.compile(r"^\^{3,}$")
-    foot_regex = foot_regex or re.compile(r"^\+{3,}$")
-
-    if isinstance(content, str):
-        content = content.splitlines()
-
-    panel_blocks = []
+    match_delimiter = match_delimiter or get_delimiter_matcher(*DEFAULT_DELIMITERS)
+    panels = []
     start_line = 0
     header_split = footer_split = None
     for i, line in enumerate(content):
-        if panel_regex.match(line.strip()):
+        delimiter = match_delimiter(line.strip())
+        if delimiter is None:
+            continue
+        # TODO warn if multiple header_split or footer_split
+        # TODO assert header_split is before footer_split
+        if delimiter == "panel":
             if i != 0:
-                panel_blocks.append(
-                    parse_single_panel(
-                        content[start_line:i],
+                panels.append(
+                    scan_single_panel(
+                        content,
                         start_line,
+                        i,
                         header_split,
                         footer_split,
-                        content_offset,
                         default_classes,
                     )
                 )
             start_line = i + 1
             header_split = footer_split = None
-        if head_regex.match(line.strip()) and footer_split is None:
-            header_split = i - start_line
-        if foot_regex.match(line.strip()):
-            footer_split = i - start_line
-        # TODO warn if multiple header_split or footer_split
-        # TODO assert header_split is before footer_split
-    try:
-        panel_blocks.append(
-            parse_single_panel(
-                content[start_line:],
-                start_line,
-                header_split,
-                footer_split,
-                content_offset,
-                default_classes,
-            )
+        elif delimiter == "header":
+            if footer_split is None:
+                header_split = i
+        else:
+            footer_split = i
+    panels.append(
+        scan_single_panel(
+            content,
+            start_line,
+            len(content),
+            header_split,
+            footer_split,
+            default_classes,
         )
-    except IndexError:
-        pass
-    return panel_blocks
+    )
+    return panels
 
 
-def parse_single_panel(
-    content, offset, header_split, footer_split, content_offset, default_classes
-):
-    """parse each panel data to dict."""
-    output = {}
-    body_start = 0
-    body_end = len(content)
+def scan_single_panel(
+    content, start, end, header_split, footer_split, default_classes
+) -> PanelBlock:
+    """Read the options at the start of a panel, and set its regions."""
+    panel = PanelBlock(default_classes)
 
     # parse the classes required for this panel, and top/bottom images
-    classes = default_classes.copy()
-    for opt_offset, line in enumerate(content):
-        opt_match = RE_OPTIONS.match(line)
+    body_start = start
+    while body_start < end:
+        opt_match = RE_OPTIONS.match(content[body_start])
         if not opt_match:
             break
         body_start += 1
-        if opt_match.group(1) in ["img-top", "img-bottom"]:
-            output[opt_match.group(1)] = opt_match.group(3)
-            continue
-        if opt_match.group(2) == "+":
-            classes[opt_match.group(1)] = (
-                classes.get(opt_match.group(1), []) + opt_match.group(3).split()
-            )
+        key, plus, value = opt_match.groups()
+        if key in ["img-top", "img-bottom"]:
+            panel.images[key] = value
+        elif plus == "+":
+            panel.overrides[key] = panel.get_classes(key) + value.split()
         else:
-            classes[opt_match.group(1)] = opt_match.group(3).split()
-
-    if classes:
-        output["classes"] = classes
+            panel.overrides[key] = value.split()
 
+    body_end = end
     if header_split is not None:
-        header_content = content[opt_offset:header_split]
-        header_offset = content_offset + offset + opt_offset
+        panel.header = (body_start, header_split)
         body_start = header_split + 1
-        output["header"] = (header_content, header_offset)
-
     if footer_split is not None:
-        footer_content = content[footer_split + 1 :]
-        footer_offset = content_offset + offset + footer_split
+        panel.footer = (footer_split + 1, end)
         body_end = footer_split
-        output["footer"] = (footer_content, footer_offset)
-
-    body_content = content[body_start:body_end]
-    body_offset = content_offset + offset + body_start
-    output["body"] = (body_content, body_offset)
-    return output
+    panel.body = (body_start, body_end)
+    return panel
 
 
-def add_child_classes(node):
-    """Add classes to specific child nodes."""
-    for para in node.traverse(nodes.paragraph):
-        para["classes"] = ([] if "classes" in para else para["classes"]) + ["card-text"]
-    for title in node.traverse(nodes.title):
-        title["classes"] = ([] if "classes" in title else title["classes"]) + [
-            "card-title"
-        ]
+def parse_panels(
+    content,
+    content_offset,
+    default_classes,
+    panel_regex=None,
+    head_regex=None,
+    foot_regex=None,
+):
+    """split a block of content into panels, returning the data of each as a dict."""
+    if isinstance(content, str):
+        content = content.splitlines()
+    match_delimiter = get_delimiter_matcher(
+        *(
+            getattr(regex, "pattern", regex or default)
+            for regex, default in zip(
+                (panel_regex, head_regex, foot_regex), DEFAULT_DELIMITERS
+            )
+        )
+    )
+    return [
+        panel.as_dict(content, content_offset)
+        for panel in scan_panels(content, default_classes, match_delimiter)
+    ]
 
 
 class Panels(SphinxDirective):
@@ -160,9 +268,11 @@ class Panels(SphinxDirective):
         "footer": directives.unchanged,
         "img-top-cls": directives.unchanged,
         "img-bottom-cls": directives.unchanged,
+        "source": directives.path,
     }
 
     def run(self):
+        note_usage(self.env, "panels")
         default_classes = {
             "container": DEFAULT_CONTAINER.split(),
             "column": DEFAULT_COLUMN.split(),
@@ -184,100 +294,148 @@ class Panels(SphinxDirective):
             else:
                 default_classes[key] = option_value.split()
 
-        # split the block into panels
-        panel_blocks = parse_panels(
-            self.content,
-            self.content_offset,
-            default_classes,
-            panel_regex=self.env.app.config.panels_delimiters[0],
-            head_regex=self.env.app.config.panels_delimiters[1],
-            foot_regex=self.env.app.config.panels_delimiters[2],
-        )
+        if "source" in self.options:
+            panel_blocks = self.read_source(default_classes)
+        else:
+            # split the block into panels
+            panel_blocks = scan_panels(
+                self.content,
+                default_classes,
+                get_delimiter_matcher(
+                    *(regex.pattern for regex in self.env.app.config.panels_delimiters)
+                ),
+            )
 
         # set the top-level containers
-        parent = nodes.container(
-            is_div=True, classes=["sphinx-bs"] + default_classes["container"]
+        parent = div(
+            classes=["sphinx-bs", *intern_classes(default_classes["container"])]
         )
-        rows = nodes.container(is_div=True, classes=["row"])
+        rows = div(classes=["row"])
         parent += rows
 
-        for data in panel_blocks:
-
-            classes = data["classes"]
+        for panel in panel_blocks:
 
-            column = nodes.container(
-                is_div=True, classes=["d-flex"] + classes["column"]
+            card = panel_card(
+                classes=["card", "w-100", *intern_classes(panel.get_classes("card"))],
+                column_classes=intern_classes(["d-flex", *panel.get_classes("column")]),
             )
-            rows += column
-            card = nodes.container(
-                is_div=True, classes=["card", "w-100"] + classes["card"]
-            )
-            column += card
+            rows += card
 
-            if "img-top" in data:
-                image_top = nodes.image(
+            if "img-top" in panel.images:
+                image_top = card_image(
                     "",
-                    uri=directives.uri(data["img-top"]),
+                    uri=directives.uri(panel.images["img-top"]),
                     alt="img-top",
-                    classes=["card-img-top"] + classes["img-top-cls"],
+                    classes=[
+                        "card-img-top",
+                        *intern_classes(panel.get_classes("img-top-cls")),
+                    ],
                 )
                 self.add_name(image_top)
                 card += image_top
 
-            if "header" in data:
-                header = nodes.container(
-                    is_div=True, classes=["card-header"] + classes["header"]
+            if panel.header is not None:
+                header = card_region(
+                    classes=[
+                        "card-header",
+                        *intern_classes(panel.get_classes("header")),
+                    ]
                 )
                 card += header
 
-                header_content, header_offset = data["header"]
-                self.state.nested_parse(header_content, header_offset, header)
-                add_child_classes(header)
+                self.parse_region(panel, "header", header)
 
-            body = nodes.container(is_div=True, classes=["card-body"] + classes["body"])
+            body = card_region(
+                classes=["card-body", *intern_classes(panel.get_classes("body"))]
+            )
             card += body
 
-            body_content, body_offset = data["body"]
-            self.state.nested_parse(body_content, body_offset, body)
-            add_child_classes(body)
+            self.parse_region(panel, "body", body)
 
-            if "footer" in data:
-                footer = nodes.container(
-                    is_div=True, classes=["card-footer"] + classes["footer"]
+            if panel.footer is not None:
+                footer = card_region(
+                    classes=[
+                        "card-footer",
+                        *intern_classes(panel.get_classes("footer")),
+                    ]
                 )
                 card += footer
 
-                footer_content, footer_offset = data["footer"]
-                self.state.nested_parse(footer_content, footer_offset, footer)
-                add_child_classes(footer)
+                self.parse_region(panel, "footer", footer)
 
-            if "img-bottom" in data:
-                image_top = nodes.image(
+            if "img-bottom" in panel.images:
+                image_top = card_image(
                     "",
-                    uri=directives.uri(data["img-bottom"]),
+                    uri=directives.uri(panel.images["img-bottom"]),
                     alt="img-bottom",
-                    classes=["card-img-bottom"] + classes["img-bottom-cls"],
+                    classes=[
+                        "card-img-bottom",
+                        *intern_classes(panel.get_classes("img-bottom-cls")),
+                    ],
                 )
                 self.add_name(image_top)
                 card += image_top
 
         return [parent]
 
+    def read_source(self, default_classes: Dict[str, List[str]]) -> List[DataPanel]:
+        """Read the panels from the data file of the ``source`` option.
 
-def validate_config(app, config):
-    if len(app.config.panels_delimiters) != 3:
-        raise AssertionError(
-            "panels_delimiters config must be of form: (header, body, footer)"
-        )
-    if len(set(app.config.panels_delimiters)) != 3:
-        raise AssertionError("panels_delimiters config must contain unique values")
-    try:
-        app.config.panels_delimiters = tuple(
-            [re.compile(s) for s in app.config.panels_delimiters]
-        )
-    except Exception as err:
-        raise AssertionError(
-            "panels_delimiters config must contain only compilable regexes: {}".format(
-                err
+        The file is a dependency of the document,
+        so that the document is re-read when it changes.
+        """
+        if self.content:
+            raise self.error(
+                "The panels directive cannot have both content and a source"
+            )
+        rel_path, path = self.env.relfn2path(self.options["source"])
+        self.env.note_dependency(rel_path)
+        try:
+            cards = load_cards(path)
+        except (OSError, ValueError) as err:
+            raise self.error(f"Could not read panels source {rel_path!r}: {err}")
+        return [DataPanel(card, default_classes) for card in cards]
+
+    def parse_text(self, text: str, container: nodes.Element):
+        """Parse the text of a data card's region into its container,
+        as paragraphs of inline text, split by blank lines.
+        """
+        for block in RE_BLANK_LINES.split(text.strip()):
+            if not block:
+                continue
+            text_nodes, messages = self.state.inliner.parse(
+                block, self.lineno, self.state.memo, container
             )
+            paragraph = nodes.paragraph(block, "", *text_nodes)
+            self.set_source_info(paragraph)
+            container += [paragraph] + messages
+
+    def parse_region(self, panel: PanelBlock, name: str, container: nodes.Element):
+        """Parse the header, body or footer of a panel into its container.
+
+        A region of a single line of text (as most headers and footers are)
+        is parsed directly to a paragraph, without running a nested state machine.
+        The paragraph, its line number and any messages are the same as
+        ``nested_parse`` would create.
+        """
+        if isinstance(panel, DataPanel):
+            self.parse_text(getattr(panel, name), container)
+            return
+        start, end = getattr(panel, name)
+        offset = panel.get_offset(name, self.content_offset)
+        text_lines = [index for index in range(start, end) if self.content[index]]
+        if not text_lines:
+            return
+        if len(text_lines) > 1 or not RE_INLINE_LINE.match(self.content[text_lines[0]]):
+            self.state.nested_parse(self.content[start:end], offset, container)
+            return
+        index = text_lines[0]
+        text = self.content[index]
+        lineno = offset + index - start + 1
+        text_nodes, messages = self.state.inliner.parse(
+            text, lineno, self.state.memo, container
         )
+        paragraph = nodes.paragraph(text, "", *text_nodes)
+        source, source_offset = self.content.info(index)
+        paragraph.source, paragraph.line = source, source_offset + 1
+        container += [paragraph] + messages
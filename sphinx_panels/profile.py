@@ -0,0 +1,337 @@
+"""Profile the sphinx-panels directives, roles, post-transforms and visitors.
+
+This is used when ``panels_profile = True``.
+For each document, the number of calls and wall time are recorded per component,
+and written to ``<doctreedir>/panels-profile.json`` when the build finishes.
+With ``panels_profile_memory = True``, the largest peak of memory traced
+by ``tracemalloc`` during a call (above the memory at its start) is also recorded.
+
+Directives and roles are run while reading, possibly in parallel workers,
+so their records are stored in the environment and merged with it.
+Visitors may be run in parallel write workers, whose environment is not merged,
+so they append their records to a file per worker.
+"""
+from collections import defaultdict
+import json
+import os
+from pathlib import Path
+from time import perf_counter
+import tracemalloc
+from typing import Callable
+
+from sphinx.application import Sphinx
+from sphinx.environment import BuildEnvironment
+from sphinx.util.logging import getLogger
+
+from .lazy import DIRECTIVES, ROLES, import_object
+
+LOGGER = getLogger(__name__)
+
+REPORT_NAME = "panels-profile.json"
+WORKERS_DIR = "panels-profile"
+# the record of the outermost calls, excluding those nested in another component
+TOTAL = "total"
+# the nodes whose visitors are profiled
+NODES = (
+    "container",
+    "panel_card",
+    "dropdown_main",
+    "dropdown_title",
+    "dropdown_deferred",
+    "tabbed_input",
+    "tabbed_label",
+    "tabbed_template",
+    "opticon",
+    "fontawesome",
+    "card_image",
+)
+
+
+def setup_profile(app: Sphinx):
+    profiler = Profiler()
+    profiler.start(app)
+    app.connect("doctree-read", profiler.store_read_records)
+    app.connect("env-merge-info", merge_profiles)
+    # after the post-transforms and nodes are registered, by `setup_used_components`
+    app.connect("env-updated", profiler.profile_html_components, priority=900)
+    app.connect("html-page-context", profiler.flush_worker_records)
+    app.connect("build-finished", profiler.finish)
+
+
+def new_record():
+    """Return ``[count, seconds, peak_bytes]``."""
+    return [0, 0.0, 0]
+
+
+def add_records(target: dict, source: dict):
+    for key, (count, seconds, size) in source.items():
+        record = target.setdefault(key, new_record())
+        record[0] += count
+        record[1] += seconds
+        record[2] = max(record[2], size)
+
+
+class Profiler:
+    """Records the calls to the profiled components, in the current process."""
+
+    def __init__(self):
+        self.enabled = False
+        self.memory = False
+        # the peaks of the calls in progress, reported by the calls nested in them
+        self.peaks = []
+        self.records = defaultdict(lambda: defaultdict(new_record))
+        self.depth = 0
+        self.pid = self.records_pid = None
+        self.started_tracing = False
+
+    def wrap(self, key: str, func: Callable, get_docname: Callable, count=True):
+        """Wrap a function, to record its calls under ``key``.
+
+        :param get_docname: returns the current document, from the call arguments
+        :param count: whether to count the calls, or only add the time and memory
+        """
+
+        def _profiled(*args, **kwargs):
+            self.depth += 1
+            if self.memory:
+                start_bytes = self.start_peak()
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                seconds = perf_counter() - start
+                size = self.stop_peak() - start_bytes if self.memory else 0
+                self.depth -= 1
+                if self.records_pid != os.getpid():
+                    # records inherited by a forked worker are reported by its parent
+                    self.records.clear()
+                    self.records_pid = os.getpid()
+                records = self.records[get_docname(args) or "<unknown>"]
+                keys = (key, TOTAL) if self.depth == 0 else (key,)
+                for name in keys:
+                    record = records[name]
+                    record[0] += count
+                    record[1] += seconds
+                    record[2] = max(record[2], size)
+
+        _profiled.__name__ = getattr(func, "__name__", key)
+        return _profiled
+
+    def start_peak(self) -> int:
+        """Start tracing the peak of a call, and return the current memory.
+
+        Resetting the peak loses that of the enclosing call so far,
+        so it is kept for the enclosing call first.
+        """
+        current, peak = tracemalloc.get_traced_memory()
+        if self.peaks:
+            self.peaks[-1] = max(self.peaks[-1], peak)
+        self.peaks.append(current)
+        tracemalloc.reset_peak()
+        return current
+
+    def stop_peak(self) -> int:
+        """Return the peak of the current call, and report it to the enclosing one."""
+        peak = max(tracemalloc.get_traced_memory()[1], self.peaks.pop())
+        if self.peaks:
+            self.peaks[-1] = max(self.peaks[-1], peak)
+        return peak
+
+    def profile_class(self, key: str, cls: type, method: str, get_docname: Callable):
+        """Return a subclass, whose ``method`` is profiled."""
+        profiled = self.wrap(key, getattr(cls, method), get_docname)
+        return type(cls.__name__, (cls,), {method: profiled, "panels_profiled": True})
+
+    def start(self, app: Sphinx):
+        self.enabled = bool(app.config.panels_profile)
+        if not self.enabled:
+            return
+        self.pid = self.records_pid = os.getpid()
+        self.records.clear()
+        app.env.panels_profile = {}
+        self.memory = bool(app.config.panels_profile_memory)
+        if self.memory and not hasattr(tracemalloc, "reset_peak"):
+            LOGGER.warning("panels_profile_memory requires Python 3.9 or later")
+            self.memory = False
+        self.peaks.clear()
+        self.started_tracing = self.memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        workers_path = Path(app.doctreedir) / WORKERS_DIR
+        workers_path.mkdir(parents=True, exist_ok=True)
+        for path in workers_path.glob("*.jsonl"):
+            path.unlink()
+
+        for name, path in DIRECTIVES.items():
+            cls = import_object(path)
+            app.add_directive(
+                name,
+                self.profile_class(
+                    f"directive:{cls.__name__}", cls, "run", lambda a: a[0].env.docname
+                ),
+                override=True,
+            )
+        for name, path in ROLES.items():
+            func = import_object(path)
+            app.add_role(
+                name,
+                self.wrap(
+                    f"role:{func.__name__}",
+                    func,
+                    lambda a: a[4].document.settings.env.docname,
+                ),
+                override=True,
+            )
+
+    def store_read_records(self, app: Sphinx, doctree):
+        """Move the records of the document read into the environment."""
+        if self.enabled:
+            docname = app.env.docname
+            app.env.panels_profile[docname] = dict(self.records.pop(docname, {}))
+
+    def profile_html_components(self, app: Sphinx, env: BuildEnvironment):
+        """Profile the post-transforms and visitors, once they are registered."""
+        if not self.enabled:
+            return
+        post_transforms = app.registry.post_transforms
+        for index, cls in enumerate(post_transforms):
+            if cls.__module__.startswith(__package__) and not getattr(
+                cls, "panels_profiled", False
+            ):
+                post_transforms[index] = self.profile_class(
+                    f"post_transform:{cls.__name__}",
+                    cls,
+                    "run",
+                    lambda a: a[0].env.docname,
+                )
+
+        def get_docname(args):
+            return getattr(args[0].builder, "current_docname", None)
+
+        for handlers in app.registry.translation_handlers.values():
+            for name in NODES:
+                if name not in handlers:
+                    continue
+                visit, depart = handlers[name]
+                if visit is None or getattr(visit, "panels_profiled", False):
+                    continue
+                visit = self.wrap(f"visitor:{name}", visit, get_docname)
+                visit.panels_profiled = True
+                if depart is not None:
+                    depart = self.wrap(
+                        f"visitor:{name}", depart, get_docname, count=False
+                    )
+                handlers[name] = (visit, depart)
+
+    def flush_worker_records(
+        self, app: Sphinx, pagename, templatename, context, doctree
+    ):
+        """In a parallel write worker, append the records so far to its file,
+        since the worker's state is discarded when it exits.
+        """
+        if not self.enabled or os.getpid() == self.pid or not self.records:
+            return
+        path = Path(app.doctreedir) / WORKERS_DIR / f"{os.getpid()}.jsonl"
+        with path.open("a", encoding="utf8") as handle:
+            handle.write(json.dumps(self.records) + "\n")
+        self.records.clear()
+
+    def finish(self, app: Sphinx, exception):
+        if not self.enabled:
+            return
+        if self.started_tracing:
+            tracemalloc.stop()
+        if exception is not None:
+            return
+
+        documents = {}
+        for source in [app.env.panels_profile, self.records]:
+            for docname, records in source.items():
+                add_records(documents.setdefault(docname, {}), records)
+        workers_path = Path(app.doctreedir) / WORKERS_DIR
+        for path in sorted(workers_path.glob("*.jsonl")):
+            for line in path.read_text(encoding="utf8").splitlines():
+                for docname, records in json.loads(line).items():
+                    add_records(documents.setdefault(docname, {}), records)
+            path.unlink()
+
+        report = create_report(documents, self.memory)
+        report_path = Path(app.doctreedir) / REPORT_NAME
+        report_path.write_text(json.dumps(report, indent=1), encoding="utf8")
+        LOGGER.info(f"sphinx-panels profile written to: {report_path}")
+        LOGGER.info(format_summary(report, app.config.panels_profile_top))
+
+
+def merge_profiles(app: Sphinx, env: BuildEnvironment, docnames, other):
+    if not app.config.panels_profile:
+        return
+    for docname in docnames:
+        if docname in other.panels_profile:
+            env.panels_profile[docname] = other.panels_profile[docname]
+
+
+def format_record(record, memory: bool) -> dict:
+    count, seconds, size = record
+    if memory:
+        return {"count": count, "seconds": seconds, "peak_bytes": size}
+    return {"count": count, "seconds": seconds}
+
+
+def create_report(documents: dict, memory: bool = False) -> dict:
+    """Create the report, of the totals per component and per document.
+
+    The document ``total`` excludes calls nested inside other components,
+    so that their time is not counted twice.
+    The ``peak_bytes`` (if ``memory``) are the largest peak of a single call.
+    """
+    totals = {}
+    for records in documents.values():
+        add_records(totals, records)
+    return {
+        "components": {
+            key: format_record(record, memory)
+            for key, record in sorted(totals.items())
+            if key != TOTAL
+        },
+        "total": format_record(totals.get(TOTAL, new_record()), memory),
+        "documents": {
+            docname: {
+                "total": format_record(records.get(TOTAL, new_record()), memory),
+                "components": {
+                    key: format_record(record, memory)
+                    for key, record in sorted(records.items())
+                    if key != TOTAL
+                },
+            }
+            for docname, records in sorted(documents.items())
+        },
+    }
+
+
+def format_summary(report: dict, top: int) -> str:
+    """Format the components, and the ``top`` slowest documents."""
+
+    def format_peak(record):
+        if "peak_bytes" not in record:
+            return ""
+        return f", peak {record['peak_bytes'] / 1024:.1f} KiB"
+
+    lines = [
+        f"sphinx-panels total: {report['total']['seconds'] * 1000:.1f} ms"
+        + format_peak(report["total"])
+    ]
+    for key, record in report["components"].items():
+        lines.append(
+            f"  {key}: {record['count']} calls, {record['seconds'] * 1000:.1f} ms"
+            + format_peak(record)
+        )
+    slowest = sorted(
+        report["documents"].items(),
+        key=lambda item: item[1]["total"]["seconds"],
+        reverse=True,
+    )[:top]
+    if slowest:
+        lines.append(f"slowest {len(slowest)} documents:")
+    for docname, data in slowest:
+        lines.append(f"  {data['total']['seconds'] * 1000:8.1f} ms  {docname}")
+    return "\n".join(lines)
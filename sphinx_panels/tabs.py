@@ -1,21 +1,17 @@
-from uuid import uuid4
-from typing import Optional
+import hashlib
+from typing import List
 
 from docutils import nodes
 from docutils.parsers.rst import directives
-from sphinx.transforms.post_transforms import SphinxPostTransform
 from sphinx.util.docutils import SphinxDirective
 from sphinx.util.logging import getLogger
-from sphinx.util.nodes import NodeMatcher
-
-LOGGER = getLogger(__name__)
 
+from .containers import div
+from .fragments import FRAGMENTS_URL, get_fragment_id, get_fragments
+from .usage import note_usage
+from .utils import intern_classes
 
-def setup_tabs(app):
-    app.add_directive("tabbed", TabbedDirective)
-    app.add_post_transform(TabbedHtmlTransform)
-    app.add_node(tabbed_input, html=(visit_tabbed_input, depart_tabbed_input))
-    app.add_node(tabbed_label, html=(visit_tabbed_label, depart_tabbed_label))
+LOGGER = getLogger(__name__)
 
 
 class tabbed_input(nodes.Element, nodes.General):
@@ -46,6 +42,26 @@ def depart_tabbed_label(self, node):
     self.body.append("</label>")
 
 
+class tabbed_template(nodes.Element, nodes.General):
+    """The content of a lazy tab, added to the page when the tab is first selected."""
+
+
+def visit_tabbed_template(self, node):
+    self.body.append(self.starttag(node, "template", ""))
+    self.context.append(len(self.body))
+
+
+def depart_tabbed_template(self, node):
+    # the content is copied to the fragments, and linked to for when JavaScript is off
+    fragments = get_fragments(self.document)
+    index = len(fragments)
+    fragments.append("".join(self.body[self.context.pop() :]))
+    self.body.append(
+        f'</template><noscript><a href="{FRAGMENTS_URL}#{get_fragment_id(index)}">'
+        "Show content</a></noscript>"
+    )
+
+
 class TabbedDirective(SphinxDirective):
     """CSS-based tabs."""
 
@@ -55,6 +71,7 @@ class TabbedDirective(SphinxDirective):
     option_spec = {
         "new-group": directives.flag,
         "selected": directives.flag,
+        "lazy": directives.flag,
         "name": directives.unchanged,
         "class-label": directives.class_option,
         "class-content": directives.class_option,
@@ -62,12 +79,16 @@ class TabbedDirective(SphinxDirective):
 
     def run(self):
         self.assert_has_content()
+        note_usage(self.env, "tabbed")
+        if "lazy" in self.options:
+            note_usage(self.env, "tabbed-lazy")
 
         container = nodes.container(
             "",
             type="tabbed",
             new_group="new-group" in self.options,
             selected="selected" in self.options,
+            lazy="lazy" in self.options,
             classes=["tabbed-container"],
         )
         self.set_source_info(container)
@@ -75,13 +96,13 @@ class TabbedDirective(SphinxDirective):
         # add label as a rubric (to degrade nicely for non-html outputs)
         textnodes, messages = self.state.inline_text(self.arguments[0], self.lineno)
         label = nodes.rubric(self.arguments[0], *textnodes, classes=["tabbed-label"])
-        label["classes"] += self.options.get("class-label", [])
+        label["classes"] += intern_classes(self.options.get("class-label", []))
         self.add_name(label)
         container += label
 
         # add content
-        content = nodes.container("", is_div=True, classes=["tabbed-content"])
-        content["classes"] += self.options.get("class-content", [])
+        content = div(classes=["tabbed-content"])
+        content["classes"] += intern_classes(self.options.get("class-content", []))
         self.state.nested_parse(self.content, self.content_offset, content)
 
         container += content
@@ -90,101 +111,127 @@ class TabbedDirective(SphinxDirective):
 
 
 class TabSet:
-    def __init__(self, node):
+    """A run of consecutive ``tabbed`` siblings, at ``start``..``end`` of the parent."""
+
+    def __init__(self, node, index: int):
         self._nodes = [node]
+        self.start = self.end = index
 
-    def is_next(self, node):
-        if self.parent != node.parent:
-            return False
-        if node.parent.index(node) != (self.indices[-1] + 1):
-            return False
-        return True
+    def is_next(self, node, index: int) -> bool:
+        return node.parent is self.parent and index == self.end + 1
 
-    def append(self, node):
-        assert self.is_next(node)
+    def append(self, node, index: int):
+        assert self.is_next(node, index)
         self._nodes.append(node)
+        self.end = index
 
     @property
-    def parent(self) -> int:
+    def parent(self) -> nodes.Element:
         return self._nodes[0].parent
 
     @property
-    def nodes(self) -> int:
+    def nodes(self) -> List[nodes.Element]:
         return self._nodes[:]
 
     @property
-    def indices(self) -> int:
-        return [n.parent.index(n) for n in self._nodes]
-
+    def indices(self) -> List[int]:
+        return list(range(self.start, self.end + 1))
+
+
+class TabKeys:
+    """Short ids for the tab sets of a document, that are stable across builds,
+    made from the document name and the position of the tab set (and tab).
+    """
+
+    def __init__(self, docname: str, used_keys):
+        # the docname is hashed, so that ids do not clash in combined outputs,
+        # like singlehtml, and avoid any non-id characters
+        self._prefix = hashlib.md5(docname.encode("utf8")).hexdigest()[:8]
+        self._used_keys = set(used_keys)
+
+    def get_unique_key(self, *position: int) -> str:
+        key = "-".join(["tab", self._prefix] + [str(i) for i in position])
+        unique_key, suffix = key, 0
+        while unique_key in self._used_keys:
+            suffix += 1
+            unique_key = f"{key}_{suffix}"
+        self._used_keys.add(unique_key)
+        return unique_key
+
+
+def add_to_tab_sets(tab_sets: List[TabSet], node: nodes.container, index: int):
+    """Add a ``tabbed`` child, at ``index`` of its parent, to the parent's tab sets."""
+    if tab_sets and not node["new_group"] and tab_sets[-1].is_next(node, index):
+        tab_sets[-1].append(node, index)
+    else:
+        tab_sets.append(TabSet(node, index))
+
+
+def replace_tab_sets(parent, replacements):
+    """Replace each tab set with its container, in one splice of the parent."""
+    children = []
+    last = 0
+    for tab_set, container in replacements:
+        children.extend(parent.children[last : tab_set.start])
+        children.append(container)
+        last = tab_set.end + 1
+    children.extend(parent.children[last:])
+    parent.children = children
+
+
+def render_tab_set(
+    tab_set: TabSet, lazy: bool = False, allow_lazy: bool = True
+) -> nodes.container:
+    """Create the container for a tab set, moving the tab contents into it.
+
+    The ids are set afterwards, by ``set_tab_ids``.
+
+    :param lazy: render the content of all non-selected tabs in a ``<template>``,
+        not only of those with the ``lazy`` option
+    :param allow_lazy: whether any tabs can be lazy, which requires fragment files
+    """
+    container = div(classes=["tabbed-set"])
+    container.parent = tab_set.parent
+
+    # get the first selected node
+    selected_idx = None
+    for idx, tab in enumerate(tab_set.nodes):
+        if tab["selected"]:
+            if selected_idx is None:
+                selected_idx = idx
+            else:
+                LOGGER.warning("multiple selected tabbed directives", location=tab)
+    selected_idx = 0 if selected_idx is None else selected_idx
+
+    for idx, tab in enumerate(tab_set.nodes):
+        # TODO warn and continue if incorrect children
+        title, content = tab.children
+        # input <input checked="checked" id="id" type="radio">
+        input_node = tabbed_input("", type="radio", checked=(idx == selected_idx))
+        input_node.source, input_node.line = tab.source, tab.line
+        container += input_node
+        # label <label for="id">Title</label>
+        # TODO this actually has to be text only
+        label = tabbed_label("", *title.children)
+        label["classes"] = title["classes"]
+        container += label
+        # content
+        if allow_lazy and idx != selected_idx and (lazy or tab.get("lazy", False)):
+            template = tabbed_template("", *content.children)
+            content.children = []
+            content += template
+        container += content
 
-class TabbedHtmlTransform(SphinxPostTransform):
-    default_priority = 200
-    formats = ("html",)
+    return container
 
-    def get_unique_key(self):
-        return str(uuid4())
 
-    def run(self):
-        matcher = NodeMatcher(nodes.container, type="tabbed")
-        tab_set = None
-        for node in self.document.traverse(matcher):  # type: nodes.container
-            if tab_set is None:
-                tab_set = TabSet(node)
-            elif node["new_group"]:
-                self.render_tab_set(tab_set)
-                tab_set = TabSet(node)
-            elif tab_set.is_next(node):
-                tab_set.append(node)
-            else:
-                self.render_tab_set(tab_set)
-                tab_set = TabSet(node)
-        self.render_tab_set(tab_set)
-
-    def render_tab_set(self, tab_set: Optional[TabSet]):
-
-        if tab_set is None:
-            return
-
-        container = nodes.container("", is_div=True, classes=["tabbed-set"])
-        container.parent = tab_set.parent
-        set_identity = self.get_unique_key()
-
-        # get the first selected node
-        selected_idx = None
-        for idx, tab in enumerate(tab_set.nodes):
-            if tab["selected"]:
-                if selected_idx is None:
-                    selected_idx = idx
-                else:
-                    LOGGER.warning("multiple selected tabbed directives", location=tab)
-        selected_idx = 0 if selected_idx is None else selected_idx
-
-        for idx, tab in enumerate(tab_set.nodes):
-            # TODO warn and continue if incorrect children
-            title, content = tab.children
-            # input <input checked="checked" id="id" type="radio">
-            identity = self.get_unique_key()
-            input_node = tabbed_input(
-                "",
-                id=identity,
-                set_id=set_identity,
-                type="radio",
-                checked=(idx == selected_idx),
-            )
-            input_node.source, input_node.line = tab.source, tab.line
-            container += input_node
-            # label <label for="id">Title</label>
-            # TODO this actually has to be text only
-            label = tabbed_label("", *title.children, input_id=identity)
-            label["classes"] = title["classes"]
-            container += label
-            input_node.source, input_node.line = tab.source, tab.line
-            # content
-            container += content
-
-        # replace all nodes
-        tab_set.parent.children = (
-            tab_set.parent.children[: tab_set.indices[0]]
-            + [container]
-            + tab_set.parent.children[tab_set.indices[-1] + 1 :]
-        )
+def set_tab_ids(container: nodes.container, keys: TabKeys, set_index: int):
+    """Set the ids of the inputs and labels of a rendered tab set."""
+    set_identity = keys.get_unique_key(set_index)
+    children = container.children
+    for idx in range(len(children) // 3):
+        input_node, label = children[3 * idx], children[3 * idx + 1]
+        identity = keys.get_unique_key(set_index, idx)
+        input_node["id"] = identity
+        input_node["set_id"] = set_identity
+        label["input_id"] = identity
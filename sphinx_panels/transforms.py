@@ -0,0 +1,133 @@
+"""Rewrite the sphinx-panels nodes for HTML outputs, in a single walk of the doctree.
+
+The walk is bottom-up: each node's children are rewritten before the node,
+so nested tabs and dropdowns are rendered before those that contain them.
+"""
+from typing import List, Tuple
+
+from docutils import nodes
+from sphinx.transforms.post_transforms import SphinxPostTransform
+
+from .containers import card_region
+from .dropdown import (
+    depart_dropdown_deferred,
+    depart_dropdown_main,
+    depart_dropdown_title,
+    dropdown_deferred,
+    dropdown_main,
+    dropdown_title,
+    render_dropdown,
+    visit_dropdown_deferred,
+    visit_dropdown_main,
+    visit_dropdown_title,
+)
+from .tabs import (
+    TabKeys,
+    TabSet,
+    add_to_tab_sets,
+    depart_tabbed_input,
+    depart_tabbed_label,
+    depart_tabbed_template,
+    render_tab_set,
+    replace_tab_sets,
+    set_tab_ids,
+    tabbed_input,
+    tabbed_label,
+    tabbed_template,
+    visit_tabbed_input,
+    visit_tabbed_label,
+    visit_tabbed_template,
+)
+
+
+def setup_panels_html(app):
+    if any(issubclass(t, PanelsHtmlTransform) for t in app.registry.post_transforms):
+        return
+    app.add_node(dropdown_main, html=(visit_dropdown_main, depart_dropdown_main))
+    app.add_node(dropdown_title, html=(visit_dropdown_title, depart_dropdown_title))
+    app.add_node(
+        dropdown_deferred, html=(visit_dropdown_deferred, depart_dropdown_deferred)
+    )
+    app.add_node(tabbed_input, html=(visit_tabbed_input, depart_tabbed_input))
+    app.add_node(tabbed_label, html=(visit_tabbed_label, depart_tabbed_label))
+    app.add_node(tabbed_template, html=(visit_tabbed_template, depart_tabbed_template))
+    app.add_post_transform(PanelsHtmlTransform)
+
+
+class PanelsHtmlTransform(SphinxPostTransform):
+    """Group the tabs into tab sets, rewrite the dropdowns to ``<details>``,
+    and add the ``card-text`` / ``card-title`` classes to the paragraphs and titles
+    of the panel regions and dropdown bodies.
+    """
+
+    default_priority = 200
+    formats = ("html",)
+
+    def run(self):
+        self._css_markers = self.config.panels_dropdown_css_markers
+        self._defer_dropdowns = self.config.panels_defer_dropdowns
+        self._tabs_lazy = self.config.panels_tabs_lazy
+        # (position of the parent's first tab, the parent's rendered tab sets)
+        self._tab_sets: List[Tuple[int, List[nodes.container]]] = []
+        self._tab_count = 0
+        self.walk(self.document, False, False)
+
+        # the tab sets are numbered in document order of their parents' first tab,
+        # as they were before rendering was done bottom-up
+        keys = TabKeys(self.env.docname, self.document.ids)
+        set_index = 0
+        for _, containers in sorted(self._tab_sets, key=lambda item: item[0]):
+            for container in containers:
+                set_tab_ids(container, keys, set_index)
+                set_index += 1
+
+    def can_defer(self) -> bool:
+        """Whether the dropdown bodies (and lazy tabs) can use fragment files,
+        which is not the case for builders that embed the pages, like epub.
+        """
+        return not getattr(self.app.builder, "embedded", False)
+
+    def walk(self, node: nodes.Element, in_region: bool, in_dropdown: bool):
+        children = node.children
+        tab_sets: List[TabSet] = []
+        first_tab = None
+        for index, child in enumerate(children):
+            if not isinstance(child, nodes.Element):
+                continue
+            kind = child.get("type") if isinstance(child, nodes.container) else None
+            if kind == "tabbed":
+                if first_tab is None:
+                    first_tab = self._tab_count
+                self._tab_count += 1
+                add_to_tab_sets(tab_sets, child, index)
+
+            if child.children:
+                self.walk(
+                    child,
+                    in_region or isinstance(child, card_region),
+                    in_dropdown or kind == "dropdown",
+                )
+
+            if isinstance(child, nodes.paragraph):
+                if in_dropdown:
+                    child["classes"] = ["card-text"]
+                elif in_region and "card-text" not in child["classes"]:
+                    child["classes"].insert(0, "card-text")
+            elif isinstance(child, nodes.title):
+                if in_region and "card-title" not in child["classes"]:
+                    child["classes"].insert(0, "card-title")
+            elif kind == "dropdown":
+                defer = (
+                    self._defer_dropdowns or child.get("defer", False)
+                ) and self.can_defer()
+                newnode = render_dropdown(child, self._css_markers, defer)
+                newnode.parent = node
+                children[index] = newnode
+
+        if tab_sets:
+            replacements = [
+                (tab_set, render_tab_set(tab_set, self._tabs_lazy, self.can_defer()))
+                for tab_set in tab_sets
+            ]
+            replace_tab_sets(node, replacements)
+            self._tab_sets.append((first_tab, [c for _, c in replacements]))
@@ -0,0 +1,92 @@
+"""Record which sphinx-panels components each document uses.
+
+This is used to only re-read the documents affected by a change
+to a ``panels_*`` configuration value.
+"""
+from typing import Iterable, List, Set
+
+from sphinx.application import Sphinx
+from sphinx.config import Config
+from sphinx.environment import BuildEnvironment
+from sphinx.util.logging import getLogger
+
+from .bootstrap import collects_classes
+
+LOGGER = getLogger(__name__)
+
+# configuration values, mapped to the components whose output they affect
+CONFIG_DEPENDENCIES = {
+    "panels_delimiters": ("panels",),
+    "panels_add_fontawesome_latex": ("fa",),
+    "panels_opticon_sprite": ("opticon", "dropdown"),
+    "panels_dropdown_css_markers": ("dropdown",),
+}
+
+
+def setup_usage(app: Sphinx):
+    app.connect("builder-inited", init_usage)
+    app.connect("env-get-outdated", get_outdated_docs)
+    app.connect("env-purge-doc", purge_usage)
+    app.connect("env-merge-info", merge_usage)
+
+
+def init_usage(app: Sphinx):
+    if not hasattr(app.env, "panels_usage"):
+        app.env.panels_usage = {}
+        app.env.panels_config = None
+
+
+def note_usage(env: BuildEnvironment, component: str):
+    """Record that the current document uses a component, e.g. ``dropdown``."""
+    env.panels_usage.setdefault(env.docname, set()).add(component)
+
+
+def get_docs_using(env: BuildEnvironment, components: Iterable[str]) -> Set[str]:
+    components = set(components)
+    return {
+        docname
+        for docname, used in env.panels_usage.items()
+        if not components.isdisjoint(used)
+    }
+
+
+def get_config_snapshot(config: Config) -> dict:
+    """Return the configuration values that affect reading the documents."""
+    snapshot = {name: config[name] for name in CONFIG_DEPENDENCIES}
+    # these are compiled to regexes, when the config is initialised
+    snapshot["panels_delimiters"] = tuple(
+        getattr(delimiter, "pattern", delimiter)
+        for delimiter in config.panels_delimiters
+    )
+    snapshot["panels_collect_classes"] = bool(collects_classes(config))
+    return snapshot
+
+
+def get_outdated_docs(
+    app: Sphinx, env: BuildEnvironment, added, changed, removed
+) -> List[str]:
+    """Return the documents affected by changes to the configuration."""
+    previous = env.panels_config
+    current = env.panels_config = get_config_snapshot(app.config)
+    if previous is None:
+        return []
+    outdated = set()
+    for name, components in CONFIG_DEPENDENCIES.items():
+        if previous.get(name) != current[name]:
+            docnames = get_docs_using(env, components)
+            LOGGER.debug(f"{name} changed; re-reading {len(docnames)} documents")
+            outdated.update(docnames)
+    if current["panels_collect_classes"] and not previous.get("panels_collect_classes"):
+        # the classes must be collected from all documents
+        outdated.update(env.all_docs)
+    return sorted(outdated)
+
+
+def purge_usage(app: Sphinx, env: BuildEnvironment, docname: str):
+    env.panels_usage.pop(docname, None)
+
+
+def merge_usage(app: Sphinx, env: BuildEnvironment, docnames, other):
+    for docname in docnames:
+        if docname in other.panels_usage:
+            env.panels_usage[docname] = other.panels_usage[docname]
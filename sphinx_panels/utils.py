@@ -1,12 +1,23 @@
 from ast import literal_eval
+from functools import lru_cache
 import re
+import sys
+from typing import Iterable, Tuple
 
-REGEX = re.compile(
-    r'\s*(?:(?P<key>[a-zA-Z0-9_]+)\s*\=)?\s*(?P<value>".*"|[^,]+)\s*(?:,|$)'
-)
+# the start of a value: at the start of the text, after a comma or after ``key=``
+RE_VALUE_START = re.compile(r"\s*(?:[a-zA-Z0-9_]+\s*=\s*)?")
+# a quoted string, that may be unterminated
+RE_QUOTED = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"?|\'[^\'\\]*(?:\\.[^\'\\]*)*\'?', re.S)
+RE_KEY = re.compile(r"\s*([a-zA-Z0-9_]+)\s*=")
+RE_WORD = re.compile(r"[a-zA-Z_][a-zA-Z0-9_-]*")
+# words that ``literal_eval`` does not return as strings
+LITERAL_WORDS = ("True", "False", "None")
 
 
 def eval_literal(string):
+    if RE_WORD.fullmatch(string) and string not in LITERAL_WORDS:
+        # not a literal, e.g. a class name
+        return string
     try:
         value = literal_eval(string)
     except Exception:
@@ -14,12 +25,143 @@ def eval_literal(string):
     return value
 
 
-def string_to_func_inputs(text):
+def split_arguments(text: str):
+    """Split the text on the commas that are not in quotes, in a single pass.
+
+    Quotes (``"`` or ``'``) only start a string at the start of a value,
+    so apostrophes in words (e.g. ``don't``) are kept as is.
+    Quoted strings may contain escaped quotes;
+    an unterminated quote extends to the end of the text.
+    """
+    fragments = []
+    start = 0
+    while True:
+        position = RE_VALUE_START.match(text, start).end()
+        quoted = RE_QUOTED.match(text, position)
+        if quoted:
+            position = quoted.end()
+        comma = text.find(",", position)
+        if comma == -1:
+            fragments.append(text[start:])
+            return fragments
+        fragments.append(text[start:comma])
+        start = comma + 1
+
+
+@lru_cache(maxsize=1024)
+def parse_func_inputs(text):
     args = []
     kwargs = {}
-    for key, value in REGEX.findall(text):
-        if key:
-            kwargs[key.strip()] = eval_literal(value.strip())
+    for fragment in split_arguments(text):
+        match = RE_KEY.match(fragment)
+        value = fragment[match.end() :].strip() if match else ""
+        if value:
+            kwargs[match.group(1)] = eval_literal(value)
+        elif fragment.strip():
+            # including a key without a value, e.g. ``a=``
+            args.append(eval_literal(fragment.strip()))
+    return tuple(args), kwargs
+
+
+def string_to_func_inputs(text):
+    """Parse the text of a role, e.g. ``a, b="c,d", e=1``,
+    to the arguments and keyword arguments of a function.
+
+    The results are cached by text, since the same inputs are often repeated.
+    """
+    args, kwargs = parse_func_inputs(text)
+    return list(args), dict(kwargs)
+
+
+@lru_cache(maxsize=1024)
+def _intern_classes(classes: Tuple[str, ...]) -> Tuple[str, ...]:
+    return tuple(sys.intern(name) for name in classes)
+
+
+def intern_classes(classes: Iterable[str]) -> Tuple[str, ...]:
+    """Return the classes as a shared tuple of interned strings.
+
+    Nodes with the same classes then reference the same objects,
+    which are written once per pickled doctree, rather than once per node.
+    """
+    return _intern_classes(tuple(classes))
+
+
+RE_CSS_CLASS = re.compile(r"\.(-?[_a-zA-Z][_a-zA-Z0-9-]*)")
+RE_CSS_NOT = re.compile(r":not\([^)]*\)")
+
+
+def iter_css_blocks(css: str):
+    """Yield the top-level ``(prelude, body)`` of each CSS rule,
+    or ``(statement, None)`` for at-rules without a block, like ``@charset``.
+    """
+    depth = 0
+    start = block_start = 0
+    quote = None
+    for index, char in enumerate(css):
+        if quote:
+            if char == quote and css[index - 1] != "\\":
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char == "{":
+            if depth == 0:
+                block_start = index
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                yield css[start:block_start].strip(), css[block_start + 1 : index]
+                start = index + 1
+        elif char == ";" and depth == 0:
+            yield css[start : index + 1].strip(), None
+            start = index + 1
+
+
+def split_selectors(prelude: str):
+    """Split a selector list on commas, that are not inside brackets."""
+    selectors = []
+    depth = start = 0
+    for index, char in enumerate(prelude):
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif char == "," and depth == 0:
+            selectors.append(prelude[start:index].strip())
+            start = index + 1
+    selectors.append(prelude[start:].strip())
+    return selectors
+
+
+def selector_classes(selector: str):
+    """Return the classes an element must have to match the selector,
+    i.e. ignoring those in ``:not(...)``.
+    """
+    return set(RE_CSS_CLASS.findall(RE_CSS_NOT.sub("", selector)))
+
+
+def prune_css(css: str, classes) -> str:
+    """Remove the selectors from ``css`` that reference classes not in ``classes``,
+    and any rules (or ``@media`` blocks) left empty.
+    """
+    classes = set(classes)
+    output = []
+    for prelude, body in iter_css_blocks(css):
+        if body is None:
+            output.append(prelude)
+        elif prelude.startswith(("@media", "@supports")):
+            inner = prune_css(body, classes)
+            if inner:
+                output.append(f"{prelude}{{{inner}}}")
+        elif prelude.startswith("@"):
+            output.append(f"{prelude}{{{body}}}")
         else:
-            args.append(eval_literal(value.strip()))
-    return args, kwargs
+            selectors = [
+                selector
+                for selector in split_selectors(prelude)
+                if selector_classes(selector).issubset(classes)
+            ]
+            if selectors:
+                output.append(f"{','.join(selectors)}{{{body}}}")
+    return "".join(output)
@@ -0,0 +1,2 @@
+extensions = ["sphinx_panels"]
+panels_add_bootstrap_css = "used"
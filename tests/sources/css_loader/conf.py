@@ -0,0 +1,2 @@
+extensions = ["sphinx_panels"]
+panels_css_loader = True
@@ -0,0 +1,2 @@
+extensions = ["sphinx_panels"]
+panels_dropdown_css_markers = True
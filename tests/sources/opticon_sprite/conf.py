@@ -0,0 +1,2 @@
+extensions = ["sphinx_panels"]
+panels_opticon_sprite = True
@@ -0,0 +1,108 @@
+import gzip
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from sphinx_panels.assets import (
+    ASSETS_LIST_NAME,
+    MANIFEST_NAME,
+    STATIC_DIR,
+    sync_static_assets,
+)
+
+
+def content_getter(content, calls):
+    def _get():
+        calls.append(content)
+        return content
+
+    return _get
+
+
+def test_sync_static_assets(tmp_path: Path):
+    app = SimpleNamespace(outdir=str(tmp_path))
+    static_path = tmp_path / STATIC_DIR
+    calls = []
+
+    assets = {"a.1.css": content_getter("a", calls)}
+    assert sync_static_assets(app, "css", assets) is True
+    assert (static_path / "a.1.css").read_text() == "a"
+    manifest = json.loads((static_path / MANIFEST_NAME).read_text())
+    assert manifest["a.1.css"]["group"] == "css"
+    assert manifest["a.1.css"]["size"] == 1
+
+    # unchanged assets are not re-generated or re-written
+    assert sync_static_assets(app, "css", assets) is False
+    assert calls == ["a"]
+
+    # other groups are independent
+    assert sync_static_assets(app, "icons", {"b.1.svg": lambda: "b"}) is True
+    assert sync_static_assets(app, "css", assets) is False
+    assert (static_path / "b.1.svg").exists()
+
+    # old assets are removed, including the copy in _static
+    (tmp_path / "_static").mkdir()
+    (tmp_path / "_static" / "a.1.css").write_text("a")
+    assert sync_static_assets(app, "css", {"a.2.css": lambda: "a2"}) is True
+    assert not (static_path / "a.1.css").exists()
+    assert not (tmp_path / "_static" / "a.1.css").exists()
+    assert not (tmp_path / "_static" / "a.1.css.gz").exists()
+    assert sorted(p.name for p in static_path.iterdir() if ".br" not in p.name) == [
+        MANIFEST_NAME,
+        "a.2.css",
+        "a.2.css.gz",
+        "b.1.svg",
+        "b.1.svg.gz",
+        ASSETS_LIST_NAME,
+    ]
+
+
+def test_sync_static_assets_untracked(tmp_path: Path):
+    """Files written before the manifest was introduced are removed."""
+    app = SimpleNamespace(outdir=str(tmp_path))
+    static_path = tmp_path / STATIC_DIR
+    static_path.mkdir()
+    (static_path / "old.css").write_text("old")
+    sync_static_assets(app, "css", {"new.css": lambda: "new"})
+    assert sorted(p.name for p in static_path.iterdir() if ".br" not in p.name) == [
+        MANIFEST_NAME,
+        "new.css",
+        "new.css.gz",
+        ASSETS_LIST_NAME,
+    ]
+
+
+def test_sync_static_assets_compressed(tmp_path: Path):
+    app = SimpleNamespace(outdir=str(tmp_path))
+    static_path = tmp_path / STATIC_DIR
+    content = ".a{color:red}" * 100
+    sync_static_assets(app, "css", {"a.1.css": lambda: content})
+    sync_static_assets(app, "images", {"b.1.png": lambda: b"png"})
+    sync_static_assets(
+        app, "loader", {"loader.css": lambda: "@import"}, hashed_names=False
+    )
+    compressed = (static_path / "a.1.css.gz").read_bytes()
+    assert gzip.decompress(compressed).decode("utf8") == content
+    # the output is reproducible
+    assert compressed[4:8] == b"\0\0\0\0"
+
+    # only the hashed text assets are compressed and listed
+    assets = json.loads((static_path / ASSETS_LIST_NAME).read_text())
+    assert sorted(assets) == ["a.1.css", "b.1.png"]
+    assert assets["a.1.css"]["size"] == len(content)
+    assert assets["a.1.css"]["gzip"] == len(compressed)
+    assert set(assets["b.1.png"]) == {"md5", "size"}
+    assert not (static_path / "b.1.png.gz").exists()
+    assert not (static_path / "loader.css.gz").exists()
+
+
+def test_sync_static_assets_brotli(tmp_path: Path):
+    brotli = pytest.importorskip("brotli")
+    app = SimpleNamespace(outdir=str(tmp_path))
+    static_path = tmp_path / STATIC_DIR
+    sync_static_assets(app, "css", {"a.1.css": lambda: "a"})
+    assert brotli.decompress((static_path / "a.1.css.br").read_bytes()) == b"a"
+    assets = json.loads((static_path / ASSETS_LIST_NAME).read_text())
+    assert set(assets["a.1.css"]) == {"md5", "size", "gzip", "br"}
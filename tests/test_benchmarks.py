@@ -0,0 +1,32 @@
+import json
+from pathlib import Path
+import subprocess
+import sys
+
+BENCHMARKS = Path(__file__).parent.parent / "benchmarks"
+
+
+def test_benchmark_run_and_compare(tmp_path: Path):
+    output = tmp_path / "results.json"
+    subprocess.run(
+        [sys.executable, str(BENCHMARKS / "run.py"), "run"]
+        + ["-n", "2", "-m", "1", "-d", "2", "-o", str(output)],
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+    results = json.loads(output.read_text(encoding="utf8"))
+    assert results["metrics"]["warnings"] == 0
+    assert results["counts"]["directive.Panels.run"] == 2
+    assert results["metrics"]["html_bytes"] > 0
+
+    # a self-comparison passes, an inflated baseline-relative metric fails
+    compare = [sys.executable, str(BENCHMARKS / "run.py"), "compare"]
+    assert subprocess.run(compare + [str(output), str(output)]).returncode == 0
+    results["metrics"]["html_bytes"] *= 2
+    regressed = tmp_path / "regressed.json"
+    regressed.write_text(json.dumps(results), encoding="utf8")
+    proc = subprocess.run(
+        compare + [str(output), str(regressed)], stdout=subprocess.PIPE, text=True
+    )
+    assert proc.returncode == 1
+    assert "REGRESSION html_bytes" in proc.stdout
@@ -27,3 +27,20 @@ def test_opticon_with_options():
         '<path fill-rule="evenodd" d="M6 12a2 2 0 11-4 0 2 2 0 014 0zm8 0a2 2 0 11-4 '
         '0 2 2 0 014 0zm6 2a2 2 0 100-4 2 2 0 000 4z"></path></svg>'
     )
+
+
+def test_opticon_index_up_to_date():
+    """The shipped index should be regenerated when the JSON data changes."""
+    expected = icons.compile_opticon_index(icons.get_opticon_data())
+    assert icons.INDEX_PATH.read_bytes() == expected
+
+
+def test_opticon_index_matches_data():
+    data = icons.get_opticon_data()
+    assert icons.list_opticons() == list(data)
+    for name, icon in data.items():
+        for size, size_data in icon["heights"].items():
+            assert icons.get_opticon_size_data(name, int(size)) == {
+                "path": size_data["path"],
+                "width": size_data["width"],
+            }
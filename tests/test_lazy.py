@@ -0,0 +1,39 @@
+import subprocess
+import sys
+
+from sphinx_panels.lazy import import_object, lazy_class, lazy_function
+from sphinx_panels.utils import string_to_func_inputs
+
+
+def test_lazy_directive():
+    cls = lazy_class("panels:Panels")
+    assert cls.option_spec is import_object("panels:Panels").option_spec
+    assert cls.has_content is True
+
+
+def test_lazy_class():
+    cls = lazy_class("tabs:TabSet")
+    assert cls.__name__ == "TabSet"
+    assert cls.is_next is import_object("tabs:TabSet").is_next
+    assert type(cls(None, 0)) is import_object("tabs:TabSet")
+
+
+def test_lazy_function():
+    func = lazy_function("utils:string_to_func_inputs")
+    assert func.__name__ == "string_to_func_inputs"
+    assert func("a,b=1") == string_to_func_inputs("a,b=1")
+
+
+def test_setup_imports():
+    """The modules of features that are off, or only for HTML, are not imported."""
+    code = (
+        "import sys; from unittest import mock; import sphinx_panels; "
+        "sphinx_panels.setup(mock.Mock()); "
+        "print(sorted(m for m in sys.modules if m.startswith('sphinx_panels.')))"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], stdout=subprocess.PIPE, text=True, check=True
+    )
+    modules = {m.split(".")[1] for m in eval(output.stdout)}
+    for name in ("bundles", "critical", "fragments", "images", "links", "profile"):
+        assert name not in modules
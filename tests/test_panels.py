@@ -1,6 +1,14 @@
+import re
+
 import pytest
 
-from sphinx_panels.panels import parse_panels
+from sphinx_panels.card_data import load_cards, parse_cards
+from sphinx_panels.panels import (
+    DataPanel,
+    get_delimiter_matcher,
+    parse_panels,
+    scan_panels,
+)
 
 
 @pytest.mark.parametrize(
@@ -21,3 +29,81 @@ from sphinx_panels.panels import parse_panels
 def test_parse_panels(content, expected):
     output = parse_panels(content, content_offset=0, default_classes={})
     assert output == expected
+
+
+def test_scan_panels():
+    content = ":card: + a\nh\n===\nb\n~~~\nc\n:::\nd".splitlines()
+    default_classes = {"card": ["shadow"], "body": []}
+    panels = scan_panels(
+        content,
+        default_classes,
+        get_delimiter_matcher(r"^:{3,}$", "^={3,}$", "^~{3,}$"),
+    )
+    assert [(p.header, p.body, p.footer) for p in panels] == [
+        ((1, 2), (3, 4), (5, 6)),
+        (None, (7, 8), None),
+    ]
+    assert panels[0].get_classes("card") == ["shadow", "a"]
+    assert panels[1].get_classes("card") == ["shadow"]
+    # the default classes are shared, not copied
+    assert panels[1].defaults is default_classes
+
+
+@pytest.mark.parametrize(
+    "delimiters,line",
+    (
+        ((r"^(=)\1{2,}$", r"^\^{3,}$", r"^(\+)\1{2,}$"), "==="),
+        ((r"^(?P<c>-)(?P=c){2,}$", r"^(?P<c>\^){3,}$", r"^\+{3,}$"), "---"),
+        ((r"(?i)^x{3,}$", r"^\^{3,}$", r"^\+{3,}$"), "XXX"),
+    ),
+)
+def test_delimiter_groups(delimiters, line):
+    """Delimiters with backreferences, named groups or flags are matched in turn."""
+    match_delimiter = get_delimiter_matcher(*delimiters)
+    assert match_delimiter(line) == "panel"
+    assert match_delimiter("^^^") == "header"
+    assert match_delimiter("+++") == "footer"
+    assert match_delimiter("=-=") is None
+    panels = scan_panels(["a", line, "b"], {}, match_delimiter)
+    assert [p.body for p in panels] == [(0, 1), (2, 3)]
+
+
+@pytest.mark.parametrize(
+    "text,suffix",
+    (
+        ('[{"header": "a", "body": "b", "card": "+ x"}, {"body": 1}]', ".json"),
+        ("- header: a\n  body: b\n  card: + x\n- body: 1\n", ".yaml"),
+        ("header,body,card\na,b,+ x\n,1,\n", ".csv"),
+    ),
+)
+def test_parse_cards(text, suffix):
+    cards = parse_cards(text, suffix)
+    assert cards == ({"header": "a", "body": "b", "card": "+ x"}, {"body": "1"})
+    panel = DataPanel(cards[0], {"card": ["shadow"]})
+    assert (panel.header, panel.body, panel.footer) == ("a", "b", None)
+    assert panel.get_classes("card") == ["shadow", "x"]
+
+
+@pytest.mark.parametrize(
+    "text,suffix,error",
+    (
+        ('{"body": "a"}', ".json", "must contain a list"),
+        ('["a"]', ".json", "card 0 is not a mapping"),
+        ("- body: a\n  title: b\n", ".yaml", "unknown keys: ['title']"),
+        ("body: a", ".toml", "unknown format"),
+    ),
+)
+def test_parse_cards_invalid(text, suffix, error):
+    with pytest.raises(ValueError, match=re.escape(error)):
+        parse_cards(text, suffix)
+
+
+def test_load_cards_cached(tmp_path):
+    path = tmp_path / "cards.json"
+    path.write_text('[{"body": "a"}]', encoding="utf8")
+    cards = load_cards(path)
+    # the same content is parsed once, wherever it is
+    (tmp_path / "copy.json").write_text('[{"body": "a"}]', encoding="utf8")
+    assert load_cards(tmp_path / "copy.json") is cards
+    path.write_text('[{"body": "b"}]', encoding="utf8")
+    assert load_cards(path) == ({"body": "b"},)
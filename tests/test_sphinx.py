@@ -1,16 +1,20 @@
+import json
 from pathlib import Path
+import pickle
+import re
 import shutil
 
 import pytest
 from sphinx.testing.path import path
+from sphinx.util.console import strip_colors
 
-from sphinx_panels.tabs import TabbedHtmlTransform
+from sphinx_panels.bundles import BUNDLES
+from sphinx_panels.containers import panel_card
+from sphinx_panels.utils import iter_css_blocks, split_selectors
 
 
 @pytest.fixture()
-def sphinx_app_factory(make_app, tmp_path: Path, monkeypatch):
-    monkeypatch.setattr(TabbedHtmlTransform, "get_unique_key", lambda self: "mock-uuid")
-
+def sphinx_app_factory(make_app, tmp_path: Path):
     def _func(src_folder, **kwargs):
         shutil.copytree(
             (Path(__file__).parent / "sources" / src_folder), tmp_path / src_folder
@@ -21,7 +25,9 @@ def sphinx_app_factory(make_app, tmp_path: Path, monkeypatch):
     yield _func
 
 
-@pytest.mark.parametrize("folder", ["tabbed_basic", "dropdown_basic"])
+@pytest.mark.parametrize(
+    "folder", ["tabbed_basic", "dropdown_basic", "dropdown_css_markers"]
+)
 def test_sources(sphinx_app_factory, file_regression, folder):
     app = sphinx_app_factory(folder)
     app.build()
@@ -33,3 +39,469 @@ def test_sources(sphinx_app_factory, file_regression, folder):
         encoding="utf8",
         extension=".xml",
     )
+
+
+def test_reproducible_html(sphinx_app_factory, make_app, tmp_path: Path):
+    app = sphinx_app_factory("tabbed_basic", builddir=path(str(tmp_path / "first")))
+    app.build()
+    rebuild = make_app(
+        srcdir=app.srcdir, builddir=path(str(tmp_path / "second")), freshenv=True
+    )
+    rebuild.build()
+    assert (Path(app.outdir) / "index.html").read_bytes() == (
+        Path(rebuild.outdir) / "index.html"
+    ).read_bytes()
+
+
+@pytest.mark.parametrize(
+    "folder,overrides,templates",
+    [
+        ("tabbed_basic", {}, 0),
+        ("tabbed_basic", {"panels_tabs_lazy": True}, 2),
+        ("tabbed_lazy", {}, 1),
+    ],
+)
+def test_lazy_tabs(sphinx_app_factory, folder, overrides, templates):
+    app = sphinx_app_factory(folder, confoverrides=overrides)
+    app.build()
+    assert app._warning.getvalue() == ""
+    index = (Path(app.outdir) / "index.html").read_text(encoding="utf8")
+    assert index.count("<template>") == templates
+    assert index.count("<noscript>") == templates
+    scripts = list((Path(app.outdir) / "_static").glob("panels-tabs.*.js"))
+    if templates:
+        assert len(scripts) == 1
+        assert f'<script defer="defer" src="_static/{scripts[0].name}">' in index
+    else:
+        assert not scripts
+    if folder == "tabbed_lazy":
+        template = index.split("<template>")[1].split("</template>")[0]
+        assert "Tab 2 content" in template
+        assert "tab-2.png" in template
+        # the content is only written once to the page,
+        # and linked to in the fragment file for when JavaScript is off
+        assert index.count("Tab 2 content") == 1
+        (fragments,) = Path(app.outdir).glob("index.*.panels.html")
+        noscript = index.split("<noscript>")[1].split("</noscript>")[0]
+        assert f'<a href="{fragments.name}#panels-fragment-0">' in noscript
+        content = fragments.read_text(encoding="utf8")
+        assert f'<div id="panels-fragment-0">\n{template}</div>' in content
+
+
+def test_deferred_dropdowns(sphinx_app_factory, make_app):
+    app = sphinx_app_factory("dropdown_defer")
+    app.build()
+    assert app._warning.getvalue() == ""
+    outdir = Path(app.outdir)
+    index = (outdir / "index.html").read_text(encoding="utf8")
+    fragments = list(outdir.glob("index.*.panels.html"))
+    assert len(fragments) == 1
+    content = fragments[0].read_text(encoding="utf8")
+    # the closed deferred bodies are only in the fragment file
+    for text in ("Deferred content", "Nested content"):
+        assert text not in index
+        assert text in content
+    for text in ("Opened content", "Inline content"):
+        assert text in index
+        assert text not in content
+    assert f'data-fragment-url="{fragments[0].name}"' in index
+    assert f'href="{fragments[0].name}#panels-fragment-0"' in index
+    assert f'data-fragment-url="{fragments[0].name}"' in content
+    assert list((outdir / "_static").glob("panels-dropdowns.*.js"))
+
+    # the previous fragment file is removed, when the bodies change
+    source = Path(app.srcdir) / "index.rst"
+    source.write_text(
+        source.read_text(encoding="utf8").replace("Nested content", "Changed"),
+        encoding="utf8",
+    )
+    make_app(srcdir=app.srcdir).build()
+    names = [p.name for p in outdir.glob("index.*.panels.html")]
+    assert len(names) == 1 and names != [fragments[0].name]
+    record = json.loads((outdir / ".panels-fragments.json").read_text("utf8"))
+    assert record == {"index": names[0]}
+
+    # and when the page no longer has deferred bodies
+    source.write_text(
+        source.read_text(encoding="utf8").replace(":defer:", ""), encoding="utf8"
+    )
+    make_app(srcdir=app.srcdir).build()
+    assert not list(outdir.glob("*.panels.html"))
+    assert not (outdir / ".panels-fragments.json").exists()
+
+
+def get_img_tags(app):
+    index = (Path(app.outdir) / "index.html").read_text(encoding="utf8")
+    return re.findall(r"<img [^>]*>", index)
+
+
+def test_card_images(sphinx_app_factory):
+    app = sphinx_app_factory("panels_images", confoverrides={"panels_img_priority": 1})
+    app.build()
+    assert app._warning.getvalue() == ""
+    first, second, third, remote = get_img_tags(app)
+    assert 'width="800"' in first and 'height="400"' in first
+    assert 'fetchpriority="high"' in first and "loading" not in first
+    for tag in (second, third):
+        assert 'width="800"' in tag and 'height="400"' in tag
+        assert 'loading="lazy"' in tag and 'decoding="async"' in tag
+    assert "width" not in remote and 'loading="lazy"' in remote
+    assert "srcset" not in first
+
+
+def test_card_images_other_builder(sphinx_app_factory, make_app):
+    # the card images are only collected by HTML builds, which share the environment
+    app = sphinx_app_factory("panels_images", buildername="latex")
+    app.build()
+    assert app.env.panels_usage["index"] == {"panels"}
+    rebuild = make_app(srcdir=app.srcdir)
+    rebuild.build()
+    assert "reading sources... [100%] index" in strip_colors(rebuild._status.getvalue())
+    assert 'width="800"' in get_img_tags(rebuild)[0]
+
+
+def test_card_images_srcset(sphinx_app_factory):
+    pytest.importorskip("PIL")
+    app = sphinx_app_factory(
+        "panels_images", confoverrides={"panels_img_srcset": [200, 400, 1600]}
+    )
+    app.build()
+    assert app._warning.getvalue() == ""
+    variants = sorted(p.name for p in (Path(app.outdir) / "_static").glob("card.*"))
+    assert [name.rsplit(".", 2)[1] for name in variants] == ["200w", "400w"]
+    srcset = f"_static/{variants[0]} 200w, _static/{variants[1]} 400w"
+    srcset += ", _images/card.png 800w"
+    assert f'srcset="{srcset}"' in get_img_tags(app)[0]
+    assert list((Path(app.doctreedir) / "panels-images").glob("card.*"))
+
+
+def test_opticon_sprite(sphinx_app_factory):
+    app = sphinx_app_factory("opticon_sprite")
+    app.build()
+    assert app._warning.getvalue() == ""
+    sprites = list((Path(app.outdir) / "_static").glob("panels-opticons.*.svg"))
+    assert len(sprites) == 1
+    sprite = sprites[0].read_text(encoding="utf8")
+    for symbol in ("report-16", "alert-24", "chevron-up-24", "chevron-down-24"):
+        assert f'<symbol id="octicon-{symbol}"' in sprite
+    index = (Path(app.outdir) / "index.html").read_text(encoding="utf8")
+    assert index.count(f'<use href="_static/{sprites[0].name}#octicon-report-16">') == 2
+    assert 'aria-label="Alert" role="img"' in index
+    assert "<path" not in index
+    page = (Path(app.outdir) / "sub" / "page.html").read_text(encoding="utf8")
+    assert f'<use href="../_static/{sprites[0].name}#octicon-chevron-up-24">' in page
+
+
+def get_selectors(css: str):
+    selectors = []
+    for prelude, body in iter_css_blocks(css):
+        if prelude.startswith("@media"):
+            selectors.extend(get_selectors(body))
+        elif body is not None:
+            selectors.extend(split_selectors(prelude))
+    return selectors
+
+
+def test_css_bundles(sphinx_app_factory):
+    app = sphinx_app_factory("usage", confoverrides={"panels_css_bundles": True})
+    app.build()
+    assert app._warning.getvalue() == ""
+
+    def get_links(name):
+        html = (Path(app.outdir) / f"{name}.html").read_text(encoding="utf8")
+        return re.findall(r'href="_static/panels-([a-z]+)\.[0-9a-f]{32}\.css"', html)
+
+    assert get_links("panels") == ["cards", "utilities"]
+    assert get_links("dropdown") == ["cards", "utilities", "dropdown", "icons"]
+    assert get_links("plain") == []
+    assert get_links("index") == []
+
+    # the bundles contain all of the rules
+    static_path = Path(app.outdir) / "_static"
+    bundles = {
+        path.name.split(".")[0][7:]: path.read_text(encoding="utf8")
+        for path in static_path.glob("panels-*.css")
+        if path.name.split(".")[0][7:] in BUNDLES
+    }
+    assert sorted(bundles) == sorted(BUNDLES)
+    assert ".tabbed-set" in bundles["tabs"] and ":root" in bundles["tabs"]
+    assert "@keyframes panels-fade-in" in bundles["dropdown"]
+    assert ".btn-primary" in bundles["buttons"] and ".btn" not in bundles["cards"]
+    sources = "".join(
+        next(static_path.glob(f"{name}.*.css")).read_text(encoding="utf8")
+        for name in ("panels-bootstrap", "panels-main", "panels-variables")
+    )
+    assert sorted(get_selectors("".join(bundles.values()))) == sorted(
+        get_selectors(sources)
+    )
+
+
+@pytest.mark.parametrize(
+    "css_markers,expected",
+    [
+        (False, ["cards", "utilities", "dropdown", "icons"]),
+        (True, ["cards", "utilities", "dropdown"]),
+    ],
+)
+def test_css_bundles_dropdown(sphinx_app_factory, css_markers, expected):
+    app = sphinx_app_factory(
+        "usage",
+        confoverrides={
+            "panels_css_bundles": True,
+            "panels_css_critical": True,
+            "panels_dropdown_css_markers": css_markers,
+        },
+    )
+    # a page with only a dropdown, whose markers are opticons unless drawn by CSS
+    (Path(app.srcdir) / "dropdown.rst").write_text(
+        "Dropdown\n========\n\n.. dropdown::\n\n    Content\n", encoding="utf8"
+    )
+    app.build()
+    assert app._warning.getvalue() == ""
+    html = (Path(app.outdir) / "dropdown.html").read_text(encoding="utf8")
+    noscript = re.search(r"<noscript>(.*?)</noscript>", html, re.S).group(1)
+    links = re.findall(r'href="_static/panels-([a-z]+)\.[0-9a-f]{32}\.css"', noscript)
+    assert links == expected
+    css = "".join(re.findall(r"<style>(.*?)</style>", html, re.S))
+    assert (".octicon{" in css) is not css_markers
+
+
+def test_epub_assets(sphinx_app_factory):
+    app = sphinx_app_factory(
+        "usage",
+        buildername="epub",
+        confoverrides={"copyright": "2020", "version": "1.0"},
+    )
+    app.build()
+    assert app._warning.getvalue() == ""
+    static_path = Path(app.outdir) / "_static"
+    assert list(static_path.glob("panels-main.*.css"))
+    assert not list(static_path.glob("*.gz"))
+    assert not (static_path / "panels-assets.json").exists()
+
+
+def test_link_roles(sphinx_app_factory):
+    app = sphinx_app_factory("link_roles")
+    app.build()
+    assert app._warning.getvalue() == ""
+    html = (Path(app.outdir) / "index.html").read_text(encoding="utf8")
+    assert '<span class="xref std std-ref">some text</span>' in html
+    assert 'href="#pkg.Foo"><span class="xref py py-class">Foo class' in html
+    assert 'href="other.html"><span class="xref std std-doc">the doc' in html
+    html = (Path(app.outdir) / "other.html").read_text(encoding="utf8")
+    assert 'href="index.html#top"><span class="xref std std-ref">back' in html
+    assert 'href="index.html"><span class="xref std std-doc">index' in html
+    # the targets are indexed once per build, for each domain and role
+    assert sorted(app.builder.panels_link_targets) == [
+        ("py", "class"),
+        ("std", "doc"),
+        ("std", "ref"),
+    ]
+
+
+def test_link_roles_missing(sphinx_app_factory):
+    app = sphinx_app_factory("link_roles")
+    (Path(app.srcdir) / "other.rst").write_text(
+        "Other\n=====\n\n"
+        ":link-badge:`pkg.Bar,missing,role=py:class`\n"
+        ":link-badge:`other,bad,role=nope`\n",
+        encoding="utf8",
+    )
+    app.build()
+    warnings = app._warning.getvalue()
+    assert "py:class reference target not found: pkg.Bar" in warnings
+    assert "unknown reference role: 'nope'" in warnings
+
+
+def test_bootstrap_used(sphinx_app_factory):
+    app = sphinx_app_factory("bootstrap_used", parallel=2)
+    app.build()
+    assert app._warning.getvalue() == ""
+    static_path = Path(app.outdir) / "_static"
+    subsets = list(static_path.glob("panels-bootstrap.*.css"))
+    assert len(subsets) == 1
+    css = subsets[0].read_text(encoding="utf8")
+    for selector in (".card{", ".badge-primary{", ".btn-outline-primary{"):
+        assert selector in css
+    for selector in (".badge-danger{", ".btn-outline-danger{", ".col-lg-1{"):
+        assert selector not in css
+    for page in ("index.html", "other.html"):
+        html = (Path(app.outdir) / page).read_text(encoding="utf8")
+        assert f"_static/{subsets[0].name}" in html
+
+
+@pytest.mark.parametrize("dev_mode", [False, True])
+def test_css_loader(sphinx_app_factory, make_app, dev_mode):
+    app = sphinx_app_factory("css_loader", confoverrides={"panels_dev_mode": dev_mode})
+    app.build()
+    assert app._warning.getvalue() == ""
+    html = (Path(app.outdir) / "index.html").read_text(encoding="utf8")
+    assert 'href="_static/sphinx-panels.css"' in html
+    assert "panels-variables" not in html
+
+    # changing the variables only re-writes the loader, not the pages
+    rebuild = make_app(
+        srcdir=app.srcdir,
+        confoverrides={
+            "panels_dev_mode": dev_mode,
+            "panels_css_variables": {"tabs-size-label": "2rem"},
+        },
+    )
+    rebuild.build()
+    assert "no targets are out of date" in rebuild._status.getvalue()
+    loader = (Path(app.outdir) / "_static" / "sphinx-panels.css").read_text()
+    variables_name = loader.splitlines()[-1][13:-3]
+    assert variables_name.startswith("panels-variables.")
+    variables = (Path(app.outdir) / "_static" / variables_name).read_text()
+    assert "--tabs-size-label: 2rem;" in variables
+
+
+def test_critical_css(sphinx_app_factory):
+    app = sphinx_app_factory("usage", confoverrides={"panels_css_critical": True})
+    app.build()
+    assert app._warning.getvalue() == ""
+
+    def get_page(name):
+        html = (Path(app.outdir) / f"{name}.html").read_text(encoding="utf8")
+        styles = re.findall(r"<style>(.*?)</style>", html, re.S)
+        return html, "".join(styles)
+
+    html, css = get_page("panels")
+    assert ".card{" in css and ":root{" in css.replace(" ", "")
+    assert "details.dropdown" not in css and ".tabbed-set" not in css
+    assert 'media="print" onload="this.media=&#x27;all&#x27;"' in html
+    noscript = re.search(r"<noscript>(.*?)</noscript>", html, re.S).group(1)
+    assert 'rel="stylesheet" type="text/css" href="_static/panels-main.' in noscript
+    html, css = get_page("dropdown")
+    assert "details.dropdown" in css and ".octicon" in css
+    html, css = get_page("plain")
+    assert css == ""
+    assert "<noscript>" in html
+
+
+@pytest.mark.parametrize(
+    "overrides,expected",
+    [
+        ({"panels_delimiters": (r"^\={3,}$", r"^\^{3,}$", r"^\+{3,}$")}, ["panels"]),
+        ({"panels_dropdown_css_markers": True}, ["dropdown"]),
+        ({"panels_add_bootstrap_css": False}, []),
+        (
+            {"panels_add_bootstrap_css": "used"},
+            ["dropdown", "index", "panels", "plain"],
+        ),
+        ({"panels_css_critical": True}, ["dropdown", "index", "panels", "plain"]),
+    ],
+)
+def test_config_change_rereads(sphinx_app_factory, make_app, overrides, expected):
+    app = sphinx_app_factory("usage")
+    app.build()
+    assert app.env.panels_usage == {
+        "dropdown": {"dropdown", "opticon"},
+        "panels": {"panels", "card-images"},
+    }
+    rebuild = make_app(srcdir=app.srcdir, confoverrides=overrides)
+    rebuild.build()
+    status = strip_colors(rebuild._status.getvalue())
+    reread = sorted(
+        line.split()[-1]
+        for line in status.splitlines()
+        if line.startswith("reading sources...")
+    )
+    assert reread == expected
+
+
+def test_profile(sphinx_app_factory):
+    app = sphinx_app_factory("usage", confoverrides={"panels_profile": True})
+    app.build()
+    assert app._warning.getvalue() == ""
+    report = json.loads((Path(app.doctreedir) / "panels-profile.json").read_text())
+    assert report["documents"]["panels"]["components"]["directive:Panels"]["count"] == 1
+    assert report["components"]["role:opticon_role"]["count"] == 1
+    assert report["components"]["post_transform:PanelsHtmlTransform"]["count"] == 4
+    assert report["components"]["visitor:dropdown_main"]["count"] == 1
+    assert "slowest 4 documents:" in strip_colors(app._status.getvalue())
+    assert "peak_bytes" not in report["total"]
+
+
+def test_profile_memory(sphinx_app_factory):
+    app = sphinx_app_factory(
+        "usage",
+        confoverrides={"panels_profile": True, "panels_profile_memory": True},
+    )
+    app.build()
+    assert app._warning.getvalue() == ""
+    report = json.loads((Path(app.doctreedir) / "panels-profile.json").read_text())
+    components = report["components"]
+    assert components["directive:Panels"]["peak_bytes"] > 0
+    # the peak of the outermost calls includes those nested in them
+    assert report["total"]["peak_bytes"] >= max(
+        record["peak_bytes"] for record in components.values()
+    )
+    assert "KiB" in strip_colors(app._status.getvalue())
+
+
+def test_panels_data(sphinx_app_factory, make_app):
+    app = sphinx_app_factory("panels_data")
+    app.build()
+    assert app._warning.getvalue() == ""
+    html = (Path(app.outdir) / "index.html").read_text(encoding="utf8")
+    assert html.count('<div class="card w-100') == 6
+    assert '<p class="card-text">In stock.</p>' in html
+    assert '<div class="card-header bg-info docutils">' in html
+    assert '<div class="card w-100 shadow text-center docutils">' in html
+    # only the document using a data file is re-read when it changes
+    (Path(app.srcdir) / "cards.csv").write_text("body\nnew row\n", encoding="utf8")
+    rebuild = make_app(srcdir=app.srcdir)
+    rebuild.build()
+    status = strip_colors(rebuild._status.getvalue())
+    reread = [
+        line.split()[-1]
+        for line in status.splitlines()
+        if line.startswith("reading sources...")
+    ]
+    assert reread == ["index"]
+    html = (Path(rebuild.outdir) / "index.html").read_text(encoding="utf8")
+    assert html.count('<div class="card w-100') == 5
+
+
+def test_panels_data_invalid(sphinx_app_factory):
+    app = sphinx_app_factory("panels_data")
+    (Path(app.srcdir) / "cards.csv").write_text("title\na\n", encoding="utf8")
+    app.build()
+    warnings = app._warning.getvalue()
+    assert "Could not read panels source 'cards.csv'" in warnings
+    assert "unknown keys: ['title']" in warnings
+
+
+def test_compact_doctree(sphinx_app_factory):
+    app = sphinx_app_factory("panels_regions")
+    app.build()
+    data = (Path(app.doctreedir) / "index.doctree").read_bytes()
+    # the icons are rendered when written, and containers have no extra attributes
+    assert b"<svg" not in data
+    assert b"is_div" not in data
+    cards = list(pickle.loads(data).traverse(panel_card))
+    assert len(cards) == 5
+    # the cards share their column classes
+    assert len({id(card["column_classes"]) for card in cards}) == 1
+
+
+def test_panels_regions(sphinx_app_factory, file_regression):
+    app = sphinx_app_factory("panels_regions")
+    app.build()
+    warnings = [
+        line.split("panels_regions/", 1)[1]
+        for line in strip_colors(app._warning.getvalue()).splitlines()
+    ]
+    doctree = app.env.get_and_resolve_doctree("index", app.builder)
+    # the line numbers are not included in the XML
+    lines = [
+        f"{node.tagname} {node.line}"
+        for node in doctree.traverse(lambda n: n.line is not None)
+    ]
+    doctree["source"] = "source"
+    file_regression.check(
+        "\n".join(warnings + lines) + "\n\n" + doctree.pformat(),
+        encoding="utf8",
+        extension=".xml",
+    )
@@ -0,0 +1,124 @@
+from time import perf_counter
+from types import SimpleNamespace
+
+from docutils import nodes
+from docutils.frontend import OptionParser
+from docutils.parsers.rst import Parser
+from docutils.utils import new_document
+
+from sphinx_panels.transforms import PanelsHtmlTransform
+
+
+def create_document(num_tabs, new_group_every=None, docname="index"):
+    settings = OptionParser(components=(Parser,)).get_default_values()
+    settings.env = SimpleNamespace(
+        docname=docname,
+        app=SimpleNamespace(builder=SimpleNamespace(embedded=False)),
+        config=SimpleNamespace(
+            panels_dropdown_css_markers=True,
+            panels_defer_dropdowns=False,
+            panels_tabs_lazy=False,
+        ),
+    )
+    document = new_document("source", settings)
+    for index in range(num_tabs):
+        document += nodes.container(
+            "",
+            nodes.rubric("", f"Tab {index}"),
+            nodes.container("", nodes.paragraph("", "content"), is_div=True),
+            type="tabbed",
+            new_group=bool(new_group_every and index % new_group_every == 0),
+            selected=False,
+        )
+    return document
+
+
+def run_transform(document):
+    PanelsHtmlTransform(document).run()
+    return document
+
+
+def test_tab_grouping():
+    document = run_transform(create_document(7, new_group_every=3))
+    assert [len(node.children) // 3 for node in document.children] == [3, 3, 1]
+    for tab_set in document.children:
+        inputs = tab_set.traverse(lambda n: n.tagname == "tabbed_input")
+        assert [i["checked"] for i in inputs][0] is True
+        assert {i["set_id"] for i in inputs} == {inputs[0]["set_id"]}
+
+
+def test_nested_tab_grouping():
+    document = create_document(3)
+    document[0][1] += create_document(2).children
+    run_transform(document)
+    assert len(document.children) == 1
+    outer = document[0]
+    assert len(outer.children) == 9
+    nested = outer[2][1]
+    assert nested["classes"] == ["tabbed-set"]
+    assert len(nested.children) == 6
+
+
+def test_dropdown_in_tab():
+    document = create_document(2)
+    document[1][1] += nodes.container(
+        "",
+        nodes.paragraph("", "title"),
+        nodes.paragraph("", "body", classes=["extra"]),
+        type="dropdown",
+        opened=False,
+        has_title=True,
+        container_classes=[],
+        title_classes=[],
+        body_classes=[],
+    )
+    run_transform(document)
+    dropdown = document[0][5][1]
+    assert dropdown.tagname == "dropdown_main"
+    title, body = dropdown.children
+    assert title.astext() == "title"
+    assert body[0]["classes"] == ["card-text"]
+
+
+def get_ids(document):
+    inputs = document.traverse(lambda n: n.tagname == "tabbed_input")
+    return [(i["set_id"], i["id"]) for i in inputs]
+
+
+def test_tab_ids():
+    document = create_document(3)
+    document[0][1] += create_document(2).children
+    document.ids["tab-6a992d55-1"] = document[0]
+    ids = get_ids(run_transform(document))
+    assert ids == [
+        ("tab-6a992d55-0", "tab-6a992d55-0-0"),
+        ("tab-6a992d55-1_1", "tab-6a992d55-1-0"),
+        ("tab-6a992d55-1_1", "tab-6a992d55-1-1"),
+        ("tab-6a992d55-0", "tab-6a992d55-0-1"),
+        ("tab-6a992d55-0", "tab-6a992d55-0-2"),
+    ]
+    # ids are stable for a document, and differ between documents
+    assert get_ids(run_transform(create_document(3))) == get_ids(
+        run_transform(create_document(3))
+    )
+    other = get_ids(run_transform(create_document(3, docname="other")))
+    assert not set(other).intersection(get_ids(run_transform(create_document(3))))
+
+
+def transform_time(num_tabs, repeats=3):
+    timings = []
+    for _ in range(repeats):
+        document = create_document(num_tabs)
+        start = perf_counter()
+        run_transform(document)
+        timings.append(perf_counter() - start)
+    return min(timings)
+
+
+def test_grouping_scales_linearly():
+    """The cost per tab should be independent of the number of tabs."""
+    small, large = 250, 4000
+    per_tab_small = transform_time(small) / small
+    per_tab_large = transform_time(large) / large
+    # quadratic behaviour would give a ratio of ~16
+    assert per_tab_large / per_tab_small < 4
@@ -15,8 +15,36 @@ from sphinx_panels import utils
         ('a,b="1"', (["a"], {"b": "1"})),
         ('a , b = "1,2" ', (["a"], {"b": "1,2"})),
         ('a , b = "1,2", sdf=4 ', (["a"], {"b": "1,2", "sdf": 4})),
-        ('a,b="""', (["a"], {"b": '"""'})),  # This is kind of wrong
+        # an unterminated quote extends to the end, and is kept as is
+        ('a,b="""', (["a"], {"b": '"""'})),
+        ('a,"b,c', (["a", '"b,c'], {})),
+        ('a="x,y", b="z"', ([], {"a": "x,y", "b": "z"})),
+        ("'a,b',c", (["a,b", "c"], {})),
+        (r'a="x\",y"', ([], {"a": 'x",y'})),
+        ("a,,b", (["a", "b"], {})),
+        ("True,None,fa-2x", ([True, None, "fa-2x"], {})),
+        # apostrophes in words are not quotes
+        ("don't,badge-primary", (["don't", "badge-primary"], {})),
+        ("What's new,cls=badge-info", (["What's new"], {"cls": "badge-info"})),
+        (
+            "https://example.com/it's,text,cls=badge-info",
+            (["https://example.com/it's", "text"], {"cls": "badge-info"}),
+        ),
+        ("a,tooltip=it's here,b", (["a", "b"], {"tooltip": "it's here"})),
+        # quotes start a string after a key
+        ("a, b = 'c,d'", (["a"], {"b": "c,d"})),
+        # a key without a value is a positional value
+        ("a=", (["a="], {})),
+        ("a=,b", (["a=", "b"], {})),
     ],
 )
 def test_string_to_func_inputs(string, expected):
     assert utils.string_to_func_inputs(string) == expected
+
+
+def test_string_to_func_inputs_cached():
+    args, kwargs = utils.string_to_func_inputs("a,b=1")
+    args.append("c")
+    kwargs["d"] = 2
+    # the cached results are not modified
+    assert utils.string_to_func_inputs("a,b=1") == (["a"], {"b": 1})